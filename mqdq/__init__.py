@@ -6,5 +6,8 @@ from . import rhyme_classes
 from . import cltk_hax
 from . import babble
 from . import elegy
+from . import reader
+from . import corpus
+from . import cache
 
 __version__ = "0.8.2"
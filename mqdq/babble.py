@@ -1,6 +1,6 @@
-from bs4 import BeautifulSoup
 from bs4.element import Tag
 from mqdq import rhyme, rhyme_classes
+from mqdq.reader import LineRecord
 from mqdq.rhyme_classes import LineSet
 from mqdq import utils
 from mqdq.utils import bookinate
@@ -14,6 +14,7 @@ import pandas as pd
 import functools
 import string
 import bisect
+from concurrent.futures import ProcessPoolExecutor
 from typing import Callable, Any, Optional, Union
 
 
@@ -326,11 +327,10 @@ class Babbler:
             return rhyme.syllabify(self.raw_source)
 
     def preprocess(self, ll):
-        # TODO it would be nice to keep the syllabified words, here
-        # so that would could return an mqdq.Line object, but the Word
-        # objects get stomped when doing line-level elisions, so it's not
-        # safe to return them to the caller when doing large amounts of
-        # Babble.
+        # Babble recombines words, so this is the word level (unelided)
+        # phonetics. The syllabifications come from the rhyme word caches,
+        # shared with everything else (line-level elision works on copies,
+        # so nothing here gets stomped).
         r = []
         for l in ll:
             x = []
@@ -436,16 +436,12 @@ class Babbler:
             yield x
 
     def _build_line(self, ary, m):
-        bs = BeautifulSoup(features="lxml")
-        l = bs.new_tag("l")
-        l["metre"] = m
-        l["pattern"] = "BABBLE"  # anything but 'corrupt' or my utils will break
-        l.append("\n")
-        for w in ary:
-            # make a copy, otherwise the source Soup gets corrupted
-            l.append(copy.copy(w["mqdq"]))
-            l.append("\n")
-        return l
+        # the words are copied, so the source lines don't get corrupted
+        return LineRecord.build(
+            # pattern can be anything but 'corrupt' or my utils will break
+            {"metre": m, "pattern": "BABBLE"},
+            [w["mqdq"] for w in ary],
+        )
 
     def _fast_forward(self, line, ls):
         fn = int(ls[0])
@@ -1052,32 +1048,90 @@ class Babbler:
 # MODULE METHODS
 
 
-def bookbabs(fn: str, name: Optional[str] = None) -> list[Babbler]:
+def _pmap(f: Callable, *iterables, workers: Optional[int] = None) -> list:
+    # map() that runs in a process pool when workers > 1. Results come back in
+    # input order. The lines are reader records (not bs4 trees), so they
+    # pickle cheaply on the way back.
+    if workers is None or workers <= 1:
+        return list(map(f, *iterables))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(f, *iterables))
+
+
+def _file_bab(fn: str, name: str) -> "Babbler":
+    # module level, so it can be sent to a worker process
+    return Babbler.from_file(fn, name=name)
+
+
+def bookbabs(
+    fn: str, name: Optional[str] = None, lazy: bool = False
+) -> Union[list[Babbler], utils.LazyList]:
+    """
+    Build one Babbler per book (division) of a file.
+
+    Args:
+        fn (str): The XML file
+        name (str, optional): Prefix for the Babbler names (default: fn)
+        lazy (bool, default=False): Return a utils.LazyList, which only parses,
+            cleans and preprocesses a book when it is indexed
+
+    Returns:
+        list[Babbler]: The Babblers
+    """
     if not name:
         name = fn
-    books = bookinate(fn)
+    books = bookinate(fn, lazy=lazy)
+    if lazy:
+        return utils.LazyList(
+            len(books), lambda i: Babbler(books[i], name="%s %d" % (name, i + 1))
+        )
     babs = []
     for i, x in enumerate(books):
         babs.append(Babbler(x, name="%s %d" % (name, i + 1)))
     return babs
 
 
-def multibabs(fns: list[str], name: Optional[str] = None) -> list[Babbler]:
+def multibabs(
+    fns: list[str], name: Optional[str] = None, workers: Optional[int] = None
+) -> list[Babbler]:
+    """
+    Build one Babbler per file.
+
+    Args:
+        fns (list of str): The XML files
+        name (str, optional): Prefix for the Babbler names
+        workers (int, optional): If > 1, parse and preprocess the files in a
+            process pool of this size. The Babblers are returned in input order.
+
+    Returns:
+        list[Babbler]: The Babblers
+    """
     if not fns:
         raise ValueError("No filenames! (check your glob?)")
-    babs = []
-    for i, fn in enumerate(fns):
-        babs.append(Babbler.from_file(fn, name="%s %d" % (name, i + 1)))
-    return babs
+    names = ["%s %d" % (name, i + 1) for i in range(len(fns))]
+    return _pmap(_file_bab, fns, names, workers=workers)
+
 
+def multi_bookbabs(
+    fns: list[str], name: Optional[str] = None, workers: Optional[int] = None
+) -> list[Babbler]:
+    """
+    Build one Babbler per book (division), for several files.
 
-def multi_bookbabs(fns: list[str], name: Optional[str] = None) -> list[Babbler]:
+    Args:
+        fns (list of str): The XML files
+        name (str, optional): Prefix for the Babbler names
+        workers (int, optional): If > 1, parse and preprocess the files in a
+            process pool of this size. The Babblers are returned in input order.
+
+    Returns:
+        list[Babbler]: The Babblers
+    """
     if not fns:
         raise ValueError("No filenames! (check your glob?)")
-    babs = []
-    for i, fn in enumerate(fns):
-        babs += bookbabs(fn, name="%s %d" % (name, i + 1))
-    return babs
+    names = ["%s %d" % (name, i + 1) for i in range(len(fns))]
+    # one task per file, so each file's books come back in one pickle
+    return [b for babs in _pmap(bookbabs, fns, names, workers=workers) for b in babs]
 
 
 def vectorise_books(fn, name):
@@ -1101,10 +1155,9 @@ def vectorise_single(fn, name):
     return final, bab
 
 
-def vectorise_multi(fns, name):
-    babs = []
-    for i, fn in enumerate(fns):
-        babs.append(Babbler.from_file(fn, name="%s %d" % (name, i + 1)))
+def vectorise_multi(fns, name, workers=None):
+    # NB: only the ingest is parallel, the examinate runs are not
+    babs = multibabs(fns, name, workers=workers)
     sizes = [len(b.raw_source) for b in sorted(babs, key=lambda b: b.name)]
     res = pd.DataFrame()
     for b in babs:
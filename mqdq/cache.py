@@ -0,0 +1,467 @@
+"""
+Persistent on-disk cache of parsed and cleaned corpora.
+
+Parsing and cleaning the XML is the first thing every workflow does, and it
+is the same work every time. This caches the cleaned Corpus (see
+corpus.Corpus) as a single uncompressed .npz of plain numeric arrays, keyed
+by a hash of the XML file contents plus the library version, so editing the
+XML or upgrading mqdq both invalidate it automatically.
+
+The per line features (see line_features) are cached too, keyed by a
+digest of the contents of each line, so distribution(cached=True) and
+friends only featurise lines they have never seen before. Those files are named for a hash
+of the feature code, so editing any feature invalidates them.
+
+By default the cache lives in $MQDQ_CACHE_DIR, or $XDG_CACHE_HOME/mqdq, or
+~/.cache/mqdq. Pass cache_dir to put it somewhere else (eg next to the XML).
+"""
+
+import functools
+import hashlib
+import os
+import pathlib
+import tempfile
+import time
+import numpy as np
+from typing import Any, Callable, IO, Optional, Union
+import mqdq
+from mqdq import corpus
+from mqdq import line_analyzer as la
+
+PathLike = Union[str, pathlib.Path]
+
+
+def default_cache_dir() -> pathlib.Path:
+    if "MQDQ_CACHE_DIR" in os.environ:
+        return pathlib.Path(os.environ["MQDQ_CACHE_DIR"])
+    xdg = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(xdg) / "mqdq"
+
+
+def file_hash(fn: PathLike) -> str:
+    """SHA-1 of the contents of a file, as hex."""
+    h = hashlib.sha1()
+    with open(fn, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(fn: PathLike, clean: bool = True) -> str:
+    # The version goes in the key because any change to the parsing or
+    # cleaning code can change what ends up in the cache.
+    return "%s-%s%s" % (file_hash(fn), mqdq.__version__, "" if clean else "-raw")
+
+
+def cache_path(
+    fn: PathLike, clean: bool = True, cache_dir: Optional[PathLike] = None
+) -> pathlib.Path:
+    d = pathlib.Path(cache_dir) if cache_dir else default_cache_dir()
+    return d / ("%s-%s.npz" % (pathlib.Path(fn).stem, cache_key(fn, clean)))
+
+
+def _atomic_write(path: pathlib.Path, write: Callable[[IO[bytes]], Any]):
+    # Write to a temp file and rename it into place, so that another process
+    # (or an interrupted notebook) never sees a half written cache file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _atomic_savez(path: pathlib.Path, arrays: dict[str, np.ndarray]):
+    _atomic_write(path, lambda fh: np.savez(fh, **arrays))
+
+
+def load_corpus(
+    fn: PathLike,
+    clean: bool = True,
+    cache_dir: Optional[PathLike] = None,
+    refresh: bool = False,
+) -> corpus.Corpus:
+    """
+    Load an MQDQ XML file as a Corpus, using the on-disk cache if possible.
+    On a miss, the file is parsed (and cleaned, including fix_meters for free
+    scansion elegy) and the result is written to the cache.
+
+    Args:
+        fn (str or Path): The XML file
+        clean (bool, default=True): Cache the cleaned lines (see corpus.Corpus.from_file)
+        cache_dir (str or Path, optional): Where to keep the cache files
+        refresh (bool, default=False): Ignore any existing cache entry and rebuild it
+
+    Returns:
+        corpus.Corpus: The result
+    """
+
+    path = cache_path(fn, clean, cache_dir)
+    if path.exists() and not refresh:
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                # read everything now, so the file can be closed
+                return corpus.Corpus.from_arrays({k: npz[k] for k in npz.files})
+        except (OSError, ValueError, KeyError):
+            # truncated or from some incompatible build, just rebuild it
+            pass
+
+    c = corpus.Corpus.from_file(str(fn), clean=clean)
+    _atomic_savez(path, c.to_arrays())
+    return c
+
+
+def clear_cache(cache_dir: Optional[PathLike] = None) -> int:
+    """
+    Delete all cached corpora (and cached line features).
+
+    Args:
+        cache_dir (str or Path, optional): Cache directory, if not the default
+
+    Returns:
+        int: The number of files removed
+    """
+    d = pathlib.Path(cache_dir) if cache_dir else default_cache_dir()
+    n = 0
+    for f in d.glob("*.npz"):
+        f.unlink()
+        n += 1
+    _FEATURE_CACHES.pop(d / _features_name(), None)
+    return n
+
+
+# A missing attribute, as opposed to an empty one, in the line digests
+_MISSING = "\x00"
+
+
+def _attr(v: Optional[str]) -> str:
+    return _MISSING if v is None else v
+
+
+def line_digests(ll) -> np.ndarray:
+    """
+    A digest of the contents of each line: the metre, the pattern and the
+    text, sy, wb and mf of every word, which is everything the line features
+    depend on.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): The lines
+
+    Returns:
+        numpy.ndarray: One 16 byte digest (dtype S16) per line
+    """
+
+    c, idx = None, None
+    if isinstance(ll, corpus.Corpus):
+        c, idx = ll, range(len(ll))
+    elif ll and all(
+        isinstance(l, corpus.CorpusLine) and l.corpus is ll[0].corpus for l in ll
+    ):
+        c, idx = ll[0].corpus, [l.index for l in ll]
+
+    if c is not None:
+        # straight from the columns
+        o = np.asarray(c.line_offsets).tolist()
+        wb = [_MISSING if i == 0 else corpus.WB[i] for i in np.asarray(c.wb).tolist()]
+        mf = [_MISSING if i == 0 else corpus.MF[i] for i in np.asarray(c.mf).tolist()]
+        has_sy = np.asarray(c.has_sy).tolist()
+        sy = [s if h else _MISSING for s, h in zip(c.sy.tolist(), has_sy)]
+        words = ["\x01".join(w) for w in zip(c.text.tolist(), sy, wb, mf)]
+        metre, pattern = c.metres().tolist(), c.patterns().tolist()
+        parts = (
+            "\x02".join([_attr(metre[i]), _attr(pattern[i])] + words[o[i] : o[i + 1]])
+            for i in idx
+        )
+    else:
+        parts = (
+            "\x02".join(
+                [_attr(l.get("metre")), _attr(l.get("pattern"))]
+                + [
+                    "\x01".join(
+                        (
+                            w.text,
+                            _attr(w.get("sy")),
+                            _attr(w.get("wb")),
+                            _attr(w.get("mf")),
+                        )
+                    )
+                    for w in l("word")
+                ]
+            )
+            for l in ll
+        )
+    return np.array(
+        [hashlib.blake2b(p.encode(), digest_size=16).digest() for p in parts],
+        dtype="S16",
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _features_name() -> str:
+    # The features are all worked out in line_analyzer (from the corpus
+    # columns), so any edit there has to invalidate the cached values, whether
+    # or not the version number changed.
+    return "features-%s-%s" % (
+        mqdq.__version__,
+        hashlib.sha1(
+            (file_hash(la.__file__) + file_hash(corpus.__file__)).encode()
+        ).hexdigest()[:16],
+    )
+
+
+# Compact the cache into a single file once it has more shards than this
+_MAX_SHARDS = 16
+
+
+class FeatureCache:
+    """
+    The cached per line feature values, for one version of the feature code.
+    Each feature has a column of values and a column of flags saying which
+    lines have one, both in the same (sorted) order as the line digests.
+
+    On disk, every update only writes the lines it adds, as a new shard (an
+    .npz of the line digests and the feature values). Loading merges the
+    shards, and once there are too many of them they are compacted into one.
+
+    Use feature_cache to get the shared instance for a directory.
+
+    Args:
+        cache_dir (str or Path, optional): Cache directory, if not the default
+    """
+
+    def __init__(self, cache_dir: Optional[PathLike] = None):
+        self.dir = pathlib.Path(cache_dir) if cache_dir else default_cache_dir()
+        self.name = _features_name()
+        self.keys = np.zeros(0, dtype="S16")
+        self.values: dict[str, np.ndarray] = {}
+        self.have: dict[str, np.ndarray] = {}
+        self.shards: list[pathlib.Path] = []
+        for path in sorted(self.dir.glob(self.name + "-*.npz")):
+            try:
+                with np.load(path, allow_pickle=False) as npz:
+                    arrays = {k: npz[k] for k in npz.files}
+                keys, values, have = arrays.pop("keys"), {}, {}
+                for k, v in arrays.items():
+                    kind, name = k.split(":", 1)
+                    (values if kind == "value" else have)[name] = v
+                self._merge(keys, values, have)
+            except (OSError, ValueError, KeyError, IndexError):
+                # damaged or from some incompatible build, skip it
+                continue
+            self.shards.append(path)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __repr__(self) -> str:
+        return "<FeatureCache %s (%d lines, %d features)>" % (
+            self.dir / self.name,
+            len(self),
+            len(self.values),
+        )
+
+    def lookup(self, keys: np.ndarray, feats: list[str]) -> tuple[np.ndarray, dict]:
+        """
+        Find some lines in the cache.
+
+        Args:
+            keys (numpy.ndarray): Line digests (see line_digests)
+            feats (list of str): The features wanted
+
+        Returns:
+            numpy.ndarray, dict: For each line, whether all of the features
+            are cached; and for each feature, its column of values (or None if
+            the feature isn't cached at all), indexed as keys
+        """
+
+        pos = np.searchsorted(self.keys, keys)
+        pos[pos == len(self.keys)] = 0
+        found = (
+            (self.keys[pos] == keys) if len(self.keys) else np.zeros(len(keys), bool)
+        )
+        hit, values = found.copy(), {}
+        for name in feats:
+            if name in self.values:
+                hit &= self.have[name][pos]
+                values[name] = self.values[name][pos]
+            else:
+                hit[:] = False
+                values[name] = None
+        return hit, values
+
+    def _merge(
+        self,
+        keys: np.ndarray,
+        values: dict[str, np.ndarray],
+        have: Optional[dict[str, np.ndarray]] = None,
+    ):
+        # keys must be sorted and unique, values and have are indexed as keys
+        # (a feature with no have flags has a value for every line)
+        merged = np.union1d(self.keys, keys)
+        old_pos = np.searchsorted(merged, self.keys)
+        new_pos = np.searchsorted(merged, keys)
+        for name in set(self.values) | set(values):
+            old, new = self.values.get(name), values.get(name)
+            dtypes = [v.dtype for v in (old, new) if v is not None]
+            col = np.zeros(len(merged), dtype=np.result_type(*dtypes))
+            col_have = np.zeros(len(merged), dtype=bool)
+            if old is not None:
+                col[old_pos], col_have[old_pos] = old, self.have[name]
+            if new is not None:
+                h = have.get(name) if have else None
+                if h is None:
+                    col[new_pos], col_have[new_pos] = new, True
+                else:
+                    col[new_pos[h]], col_have[new_pos[h]] = new[h], True
+            self.values[name], self.have[name] = col, col_have
+        self.keys = merged
+
+    def _shard_path(self) -> pathlib.Path:
+        # time first, so that sorting the names gives the order they were written
+        return self.dir / ("%s-%d-%d.npz" % (self.name, time.time_ns(), os.getpid()))
+
+    def update(self, keys: np.ndarray, values: dict[str, np.ndarray]):
+        """
+        Add (or replace) the values of some features for some lines, and
+        write them to disk as a new shard. If the cache directory isn't
+        writable, the values are still kept for the rest of this session.
+
+        Args:
+            keys (numpy.ndarray): Line digests (see line_digests)
+            values (dict[str, numpy.ndarray]): feature -> one value per key
+        """
+
+        keys, first = np.unique(keys, return_index=True)
+        values = {name: np.asarray(v)[first] for name, v in values.items()}
+        self._merge(keys, values)
+        try:
+            if len(self.shards) < _MAX_SHARDS:
+                path = self._shard_path()
+                arrays = {"value:" + name: v for name, v in values.items()}
+                _atomic_savez(path, dict(arrays, keys=keys))
+                self.shards.append(path)
+            else:
+                self.compact()
+        except OSError:
+            pass
+
+    def compact(self):
+        """
+        Rewrite everything this cache holds as a single shard, and remove the
+        shards it was read from. Shards written by other processes since this
+        cache was loaded are left alone.
+        """
+
+        arrays = {"keys": self.keys}
+        for name in self.values:
+            arrays["value:" + name] = self.values[name]
+            arrays["have:" + name] = self.have[name]
+        path = self._shard_path()
+        _atomic_savez(path, arrays)
+        for old in self.shards:
+            old.unlink(missing_ok=True)
+        self.shards = [path]
+
+
+# cache file path -> the FeatureCache loaded from it
+_FEATURE_CACHES: dict[pathlib.Path, FeatureCache] = {}
+
+
+def feature_cache(cache_dir: Optional[PathLike] = None) -> FeatureCache:
+    """
+    The FeatureCache for a directory. It is only read from disk once per
+    session.
+
+    Args:
+        cache_dir (str or Path, optional): Cache directory, if not the default
+
+    Returns:
+        FeatureCache: The result
+    """
+
+    d = pathlib.Path(cache_dir) if cache_dir else default_cache_dir()
+    path = d / _features_name()
+    if path not in _FEATURE_CACHES:
+        _FEATURE_CACHES[path] = FeatureCache(d)
+    return _FEATURE_CACHES[path]
+
+
+def line_feature_columns(
+    ll, feats: Optional[list[str]] = None, cache_dir: Optional[PathLike] = None
+) -> dict[str, np.ndarray]:
+    """
+    As line_analyzer.feature_columns, but using the on-disk feature cache (see
+    line_features). Each feature keeps its own dtype, so text features (eg
+    CAES, HARM) can be mixed with numeric ones.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        feats (list of str, default=line_analyzer.ALL_FEATURES): Features to
+            compute, from line_analyzer.FEATURES
+        cache_dir (str or Path, optional): Cache directory, if not the default
+
+    Returns:
+        dict[str, numpy.ndarray]: feature -> one value per line
+    """
+
+    feats = list(la.ALL_FEATURES if feats is None else feats)
+    la.check_features(feats)
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    if len(ll) == 0:
+        return {f: np.zeros(0, dtype=np.uint8) for f in feats}
+
+    values: dict = {}
+    cached = [f for f in dict.fromkeys(feats) if la.cacheable(f)]
+    if cached:
+        fc = feature_cache(cache_dir)
+        keys = line_digests(ll)
+        hit, values = fc.lookup(keys, cached)
+        if not hit.all():
+            miss = np.flatnonzero(~hit)
+            b = la.FeatureBatch(
+                ll.select(miss)
+                if isinstance(ll, corpus.Corpus)
+                else [ll[i] for i in miss]
+            )
+            fc.update(keys[miss], {f: b[f] for f in cached})
+            hit, values = fc.lookup(keys, cached)
+
+    rest = [f for f in feats if f not in values]
+    if rest:
+        b = la.FeatureBatch(ll)
+        values.update((f, b[f]) for f in rest)
+    return {f: values[f] for f in feats}
+
+
+def line_features(
+    ll, feats: Optional[list[str]] = None, cache_dir: Optional[PathLike] = None
+) -> np.ndarray:
+    """
+    As line_analyzer.feature_matrix, but using the on-disk feature cache. Only
+    the lines that aren't in the cache yet are featurised, and their values
+    are added to it. Features that aren't cacheable (see
+    line_analyzer.cacheable) are computed every time. As with feature_matrix,
+    text features (eg CAES, HARM) can't be mixed with numeric ones
+    (ValueError), use line_feature_columns for that.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        feats (list of str, default=line_analyzer.ALL_FEATURES): Features to
+            compute, from line_analyzer.FEATURES
+        cache_dir (str or Path, optional): Cache directory, if not the default
+
+    Returns:
+        numpy.ndarray: One row per line, with one column per feature, exactly
+        as from line_analyzer.feature_matrix
+    """
+
+    feats = list(la.ALL_FEATURES if feats is None else feats)
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    # the same checks as feature_matrix, so text and numeric features can't
+    # be mixed
+    return la._stack_columns(line_feature_columns(ll, feats, cache_dir), feats, len(ll))
@@ -7,7 +7,8 @@ may appear due to elision."""
 import copy
 import re
 import logging
-from typing import List
+from collections import OrderedDict, namedtuple
+from typing import Iterable, List
 
 from mqdq.cltk_hax.scansion_constants import ScansionConstants
 import mqdq.cltk_hax.string_utils as string_utils
@@ -19,10 +20,22 @@ __author__ = ['Todd Cook <todd.g.cook@gmail.com>']
 __license__ = 'MIT License'
 
 
+class CacheInfo(namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])):
+    """Syllabifier cache statistics, as for functools.lru_cache, plus the hit rate."""
+
+    @property
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
 class Syllabifier:
-    """Scansion constants can be modified and passed into the constructor if desired."""
+    """Scansion constants can be modified and passed into the constructor if desired.
 
-    def __init__(self, constants=ScansionConstants()):
+    Results are cached per instance, keyed by the cleaned word(s), keeping the most recently
+    used cache_size entries (0 turns the cache off)."""
+
+    def __init__(self, constants=ScansionConstants(), cache_size: int = 1 << 16):
         self.constants = constants
         self.consonant_matcher = re.compile("[{}]".format(constants.CONSONANTS))
         self.vowel_matcher = re.compile(
@@ -34,6 +47,10 @@ class Syllabifier:
         self.ACCEPTABLE_CHARS = constants.ACCENTED_VOWELS + constants.VOWELS + ' ' \
                                 + constants.CONSONANTS
         self.diphthongs = [d for d in constants.DIPTHONGS if d not in ["ui", "Ui", "uī"]]
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._hits = 0
+        self._misses = 0
 
     def syllabify(self, words: str) -> List[str]:
         """
@@ -133,12 +150,59 @@ class Syllabifier:
         cleaned = cleaned.replace("qu", "kw")
         cleaned = cleaned.replace("Qu", "Kw")
         cleaned = cleaned.replace("QU", "KW")
-        items = cleaned.strip().split(" ")
 
+        hit = self._cache.get(cleaned)
+        if hit is not None:
+            self._hits += 1
+            self._cache.move_to_end(cleaned)
+            return list(hit)
+        self._misses += 1
+
+        items = cleaned.strip().split(" ")
         for char in cleaned:
             if not char in self.ACCEPTABLE_CHARS:
+                # not cached, so this is logged every time
                 LOG.error("Unsupported character found in %s " % cleaned)
                 return items
+        syllables = self._syllabify(items)
+        if self.cache_size > 0:
+            self._cache[cleaned] = tuple(syllables)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return syllables
+
+    def syllabify_many(self, words: Iterable[str]) -> List[List[str]]:
+        """
+        Syllabify a batch of words (or space separated lists of words). Each distinct input
+        is only syllabified once, so a whole text costs about one call per word form.
+
+        :param words: iterable of strings, as for syllabify.
+        :return: list of lists of syllable strings, one per input, in order.
+
+        >>> syllabifier = Syllabifier()
+        >>> print(syllabifier.syllabify_many(["arma", "cano", "arma"]))
+        [['ar', 'ma'], ['ca', 'no'], ['ar', 'ma']]
+        """
+        words = list(words)
+        done = {w: self.syllabify(w) for w in dict.fromkeys(words)}
+        return [list(done[w]) for w in words]
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Statistics for the syllabify cache.
+
+        :return: CacheInfo of hits, misses, maxsize and currsize (and hit_rate).
+        """
+        return CacheInfo(self._hits, self._misses, self.cache_size, len(self._cache))
+
+    def cache_clear(self):
+        """Empty the syllabify cache and reset its statistics."""
+        self._cache.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def _syllabify(self, items: List[str]) -> List[str]:
+        # the uncached part of syllabify, for the (cleaned, split) items
         syllables: list = []
         for item in items:
             syllables += self._setup(item)
@@ -0,0 +1,658 @@
+"""
+Columnar in-memory store for a parsed MQDQ work.
+
+A Corpus holds every word of a work in flat arrays (text, sy, wb, mf), with
+offset arrays marking where each line and each division starts. It is built
+once per file, and then:
+
+- corpus[i] / iterating gives lightweight line views, which behave like the bs4
+  Tags (or reader.LineRecords) that the rest of mqdq expects, so existing
+  functions like line_analyzer.harmony or rhyme.syllabify accept them as-is.
+- the raw arrays are available for vectorised work over the whole text.
+- the Corpus itself can stand in for the soup, eg utils.bookref(l, corpus).
+"""
+
+import json
+import numpy as np
+from typing import Iterable, Iterator, Optional, Union
+from xml.sax.saxutils import escape
+from mqdq import reader
+from mqdq import utils
+
+# Codes for the categorical word attributes. 0 always means 'attribute not
+# present'. These are fixed so codes are comparable across corpora.
+WB = ["", "CM", "DI", "CF"]
+MF = ["", "SY", "PE", "HI", "HP"]
+WB_CODE = {v: i for i, v in enumerate(WB)}
+MF_CODE = {v: i for i, v in enumerate(MF)}
+
+
+class StringColumn:
+    """A column of strings. Held as a python list when it is built in memory,
+    or as a UTF-8 heap plus an offset array (eg after loading from disk), in
+    which case strings are decoded on access."""
+
+    __slots__ = ("_values", "_heap", "_offsets", "_buf")
+
+    def __init__(
+        self,
+        values: Optional[list[str]] = None,
+        heap: Optional[np.ndarray] = None,
+        offsets: Optional[np.ndarray] = None,
+    ):
+        self._values = values
+        self._heap = heap
+        self._offsets = offsets
+        self._buf = None
+        if heap is not None and offsets is not None:
+            # Indexing into an np.memmap is slow (every result is another
+            # memmap), so read through a plain view and a memoryview instead.
+            # Neither copies, so a mapped heap stays shared.
+            self._offsets = np.asarray(offsets)
+            self._buf = memoryview(np.asarray(heap))
+        if values is None and (heap is None or offsets is None):
+            raise ValueError("Need either values or a heap and offsets")
+
+    def __len__(self) -> int:
+        if self._values is not None:
+            return len(self._values)
+        return len(self._offsets) - 1  # type: ignore
+
+    def __getitem__(self, i: int) -> str:
+        if self._values is not None:
+            return self._values[i]
+        if i < 0:
+            i += len(self)
+        o = self._offsets
+        return str(self._buf[o[i] : o[i + 1]], "utf-8")  # type: ignore
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tolist())
+
+    def tolist(self) -> list[str]:
+        if self._values is not None:
+            return self._values
+        return [self[i] for i in range(len(self))]
+
+    def decoded(self) -> "StringColumn":
+        """Return a list backed copy, which is much faster to index into."""
+        if self._values is not None:
+            return self
+        b = self._heap.tobytes()  # type: ignore
+        o = self._offsets.tolist()  # type: ignore
+        return StringColumn([b[o[i] : o[i + 1]].decode() for i in range(len(o) - 1)])
+
+    def take(self, idx: np.ndarray) -> "StringColumn":
+        vals = self.tolist()
+        return StringColumn([vals[i] for i in idx])
+
+    def to_heap(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return (heap, offsets). heap is uint8, offsets are int64 and
+        one longer than the column."""
+        if self._values is None:
+            return self._heap, self._offsets  # type: ignore
+        encoded = [s.encode() for s in self._values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        heap = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return heap, offsets
+
+
+def _categorical(values: list[str]) -> tuple[np.ndarray, list[str]]:
+    # encode a list of strings as small int codes and a vocabulary
+    vocab: dict[str, int] = {}
+    codes = [vocab.setdefault(v, len(vocab)) for v in values]
+    return np.array(codes, dtype=np.uint16), list(vocab)
+
+
+class CorpusWord(reader._TagLike):
+    """View of one word in a Corpus."""
+
+    __slots__ = ("corpus", "index")
+    name = "word"
+
+    def __init__(self, corpus: "Corpus", index: int):
+        self.corpus = corpus
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self.corpus.text[self.index]
+
+    @property
+    def sy(self) -> Optional[str]:
+        c, i = self.corpus, self.index
+        return c.sy[i] if c.has_sy[i] else None
+
+    @property
+    def wb(self) -> Optional[str]:
+        return WB[self.corpus.wb[self.index]] or None
+
+    @property
+    def mf(self) -> Optional[str]:
+        return MF[self.corpus.mf[self.index]] or None
+
+    @property
+    def parent(self) -> "CorpusLine":
+        c = self.corpus
+        return CorpusLine(
+            c, int(np.searchsorted(c.line_offsets, self.index, "right")) - 1
+        )
+
+    def _attr(self, key: str) -> Optional[str]:
+        # this is the hot path for all the per-line analysis code, so go
+        # straight to the columns rather than through the properties
+        c, i = self.corpus, self.index
+        if key == "sy":
+            return c.sy[i] if c.has_sy[i] else None
+        elif key == "wb":
+            return WB[c.wb[i]] or None
+        elif key == "mf":
+            return MF[c.mf[i]] or None
+        return None
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return {k: v for k in reader.WORD_ATTRS if (v := getattr(self, k)) is not None}
+
+    def __copy__(self) -> reader.WordRecord:
+        return reader.WordRecord.from_tag(self)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, CorpusWord)
+            and other.corpus is self.corpus
+            and other.index == self.index
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.corpus), self.index))
+
+    def __repr__(self) -> str:
+        return "<word%s>%s</word>" % (self._render_attrs(), escape(self.text))
+
+    __str__ = __repr__
+
+
+class CorpusLine(reader._TagLike):
+    """View of one line in a Corpus. Read-only."""
+
+    __slots__ = ("corpus", "index")
+    name = "line"
+
+    def __init__(self, corpus: "Corpus", index: int):
+        self.corpus = corpus
+        self.index = index
+
+    def _attr(self, key: str) -> Optional[str]:
+        c, i = self.corpus, self.index
+        if key == "name":
+            return c.line_name[i]
+        elif key == "metre":
+            return c.metre_vocab[c.metre[i]]
+        elif key == "pattern":
+            return c.pattern_vocab[c.pattern[i]]
+        elif key == "feature":
+            return c.feature[i] or None
+        return None
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return {
+            k: v
+            for k in ("name", "metre", "pattern", "feature")
+            if (v := self._attr(k)) is not None
+        }
+
+    @property
+    def word_slice(self) -> slice:
+        o = self.corpus.line_offsets
+        return slice(int(o[self.index]), int(o[self.index + 1]))
+
+    def find_all(self, name: str) -> list:
+        if name == "word":
+            s = self.word_slice
+            return [CorpusWord(self.corpus, j) for j in range(s.start, s.stop)]
+        return []
+
+    @property
+    def text(self) -> str:
+        return " ".join(w.text for w in self("word"))
+
+    @property
+    def parent(self) -> "CorpusDivision":
+        c = self.corpus
+        return CorpusDivision(
+            c, int(np.searchsorted(c.div_offsets, self.index, "right")) - 1
+        )
+
+    def __contains__(self, w) -> bool:
+        s = self.word_slice
+        return (
+            isinstance(w, CorpusWord)
+            and w.corpus is self.corpus
+            and s.start <= w.index < s.stop
+        )
+
+    def __copy__(self) -> reader.LineRecord:
+        return reader.LineRecord.build(self.attrs, self("word"))
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, CorpusLine)
+            and other.corpus is self.corpus
+            and other.index == self.index
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.corpus), self.index))
+
+    def __repr__(self) -> str:
+        inner = "".join("%r\n" % w for w in self("word"))
+        return "<line%s>\n%s</line>" % (self._render_attrs(), inner)
+
+    __str__ = __repr__
+
+
+class CorpusDivision(reader._TagLike):
+    """View of one division (book) in a Corpus."""
+
+    __slots__ = ("corpus", "index")
+    name = "division"
+
+    def __init__(self, corpus: "Corpus", index: int):
+        self.corpus = corpus
+        self.index = index
+
+    def _attr(self, key: str) -> Optional[str]:
+        if key == "title":
+            return self.corpus.div_title[self.index]
+        return None
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return {"title": self.corpus.div_title[self.index]}
+
+    @property
+    def line_slice(self) -> slice:
+        o = self.corpus.div_offsets
+        return slice(int(o[self.index]), int(o[self.index + 1]))
+
+    def find_all(self, name: str) -> list:
+        if name == "line":
+            s = self.line_slice
+            return [CorpusLine(self.corpus, i) for i in range(s.start, s.stop)]
+        return []
+
+    def __contains__(self, l) -> bool:
+        s = self.line_slice
+        return (
+            isinstance(l, CorpusLine)
+            and l.corpus is self.corpus
+            and s.start <= l.index < s.stop
+        )
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, CorpusDivision)
+            and other.corpus is self.corpus
+            and other.index == self.index
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.corpus), self.index))
+
+    def __repr__(self) -> str:
+        return "<division%s> (%d lines)" % (
+            self._render_attrs(),
+            self.line_slice.stop - self.line_slice.start,
+        )
+
+
+class Corpus:
+    """
+    Columnar store of the lines of a work.
+
+    Word columns (one entry per word):
+        text, sy (StringColumn), wb, mf (uint8 codes into WB and MF), has_sy
+        (bool, False where the word has no sy attribute, and sy is "")
+    Line columns (one entry per line):
+        line_name, feature (StringColumn), metre, pattern (uint16 codes into
+        metre_vocab and pattern_vocab)
+    Division columns:
+        div_title (StringColumn)
+    Offsets:
+        line_offsets (n_lines + 1): index of the first word of each line
+        div_offsets (n_divisions + 1): index of the first line of each division
+
+    Build one with Corpus.from_file or Corpus.from_lines.
+    """
+
+    def __init__(
+        self,
+        text: StringColumn,
+        sy: StringColumn,
+        wb: np.ndarray,
+        mf: np.ndarray,
+        line_offsets: np.ndarray,
+        line_name: StringColumn,
+        metre: np.ndarray,
+        metre_vocab: list[str],
+        pattern: np.ndarray,
+        pattern_vocab: list[str],
+        feature: StringColumn,
+        div_offsets: np.ndarray,
+        div_title: StringColumn,
+        author: str = "",
+        title: str = "",
+        source: str = "",
+        has_sy: Optional[np.ndarray] = None,
+    ):
+        self.text = text
+        self.sy = sy
+        # missing sy attributes (everything has one, if not given)
+        self.has_sy = np.ones(len(sy), dtype=bool) if has_sy is None else has_sy
+        self.wb = wb
+        self.mf = mf
+        self.line_offsets = line_offsets
+        self.line_name = line_name
+        self.metre = metre
+        self.metre_vocab = metre_vocab
+        self.pattern = pattern
+        self.pattern_vocab = pattern_vocab
+        self.feature = feature
+        self.div_offsets = div_offsets
+        self.div_title = div_title
+        self.author = author
+        self.title = title
+        self.source = source
+
+    @classmethod
+    def from_lines(
+        cls,
+        ll: Iterable,
+        author: str = "",
+        title: str = "",
+        source: str = "",
+    ) -> "Corpus":
+        """
+        Build a Corpus from any Tag-like lines (bs4 Tags, reader.LineRecords
+        or CorpusLines). Divisions are taken from the lines' parents: every
+        time the parent changes a new division starts.
+
+        Args:
+            ll (iterable of lines): Lines to store
+
+        Returns:
+            Corpus: The result
+        """
+
+        ll = list(ll)
+        if ll and all(isinstance(l, CorpusLine) for l in ll):
+            c = ll[0].corpus
+            if all(l.corpus is c for l in ll):
+                return c.select([l.index for l in ll])
+
+        text, sy, has_sy, wb, mf = [], [], [], [], []
+        line_offsets = [0]
+        line_name, metre, pattern, feature = [], [], [], []
+        div_offsets: list[int] = []
+        div_title = []
+        last_parent = None
+
+        for i, l in enumerate(ll):
+            parent = getattr(l, "parent", None)
+            if i == 0 or parent is not last_parent:
+                div_offsets.append(i)
+                try:
+                    div_title.append(str(parent["title"]))  # type: ignore
+                except (KeyError, TypeError):
+                    div_title.append("")
+                last_parent = parent
+            for w in l("word"):
+                text.append(w.text)
+                w_sy = w.get("sy")
+                sy.append(w_sy or "")
+                has_sy.append(w_sy is not None)
+                wb.append(WB_CODE[w.get("wb", "")])
+                mf.append(MF_CODE[w.get("mf", "")])
+            line_offsets.append(len(text))
+            line_name.append(l.get("name", ""))
+            metre.append(l.get("metre", ""))
+            pattern.append(l.get("pattern", ""))
+            feature.append(l.get("feature", ""))
+        div_offsets.append(len(ll))
+
+        metre_codes, metre_vocab = _categorical(metre)
+        pattern_codes, pattern_vocab = _categorical(pattern)
+        return cls(
+            StringColumn(text),
+            StringColumn(sy),
+            np.array(wb, dtype=np.uint8),
+            np.array(mf, dtype=np.uint8),
+            np.array(line_offsets, dtype=np.int64),
+            StringColumn(line_name),
+            metre_codes,
+            metre_vocab,
+            pattern_codes,
+            pattern_vocab,
+            StringColumn(feature),
+            np.array(div_offsets, dtype=np.int64),
+            StringColumn(div_title),
+            author,
+            title,
+            source,
+            np.array(has_sy, dtype=bool),
+        )
+
+    @classmethod
+    def from_file(cls, fn: str, clean: bool = True) -> "Corpus":
+        """
+        Read an MQDQ XML file into a Corpus. The file is streamed one
+        division at a time.
+
+        Args:
+            fn (str): Filename to read
+            clean (bool, default=True): Run utils.clean on each division (drops
+                corrupt lines, fixes free scansion metres, removes elegiac
+                orphans)
+
+        Returns:
+            Corpus: The result
+        """
+        doc = reader.Document()
+        ll = []
+        for x in reader._events(fn, doc):
+            if isinstance(x, reader.Division):
+                ll += utils.clean(x("line")) if clean else x("line")
+        return cls.from_lines(ll, doc.author, doc.title, str(fn))
+
+    def select(self, idx: Iterable[int]) -> "Corpus":
+        """
+        Make a new Corpus holding only some of the lines of this one (in the
+        given order).
+
+        Args:
+            idx (iterable of int): Line indices to keep
+
+        Returns:
+            Corpus: The result
+        """
+        idx = np.asarray(
+            list(idx) if not isinstance(idx, np.ndarray) else idx, dtype=np.int64
+        )
+        starts = self.line_offsets[idx]
+        lens = self.line_offsets[idx + 1] - starts
+        line_offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(lens, out=line_offsets[1:])
+        # word indices for all the selected lines, without a python loop
+        widx = np.repeat(starts - line_offsets[:-1], lens) + np.arange(line_offsets[-1])
+
+        # new divisions start wherever the division changes
+        divs = self.line_divisions()[idx]
+        new_div = np.flatnonzero(np.diff(divs, prepend=-1))
+        div_offsets = np.append(new_div, len(idx)).astype(np.int64)
+
+        return Corpus(
+            self.text.take(widx),
+            self.sy.take(widx),
+            self.wb[widx],
+            self.mf[widx],
+            line_offsets,
+            self.line_name.take(idx),
+            self.metre[idx],
+            self.metre_vocab,
+            self.pattern[idx],
+            self.pattern_vocab,
+            self.feature.take(idx),
+            div_offsets,
+            self.div_title.take(divs[new_div]),
+            self.author,
+            self.title,
+            self.source,
+            self.has_sy[widx],
+        )
+
+    # Serialisation. Everything is flattened to plain numeric arrays (strings
+    # go into UTF-8 heaps) so that it can be stored without pickle.
+
+    _STRING_COLUMNS = ("text", "sy", "line_name", "feature", "div_title")
+    _ARRAY_COLUMNS = (
+        "wb",
+        "mf",
+        "has_sy",
+        "line_offsets",
+        "metre",
+        "pattern",
+        "div_offsets",
+    )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Flatten the Corpus to a dict of numpy arrays (suitable for np.savez).
+
+        Returns:
+            dict[str, np.ndarray]: The arrays
+        """
+        d = {k: np.asarray(getattr(self, k)) for k in self._ARRAY_COLUMNS}
+        for k in self._STRING_COLUMNS:
+            d[k + "_heap"], d[k + "_offsets"] = getattr(self, k).to_heap()
+        meta = {
+            "author": self.author,
+            "title": self.title,
+            "source": self.source,
+            "metre_vocab": self.metre_vocab,
+            "pattern_vocab": self.pattern_vocab,
+        }
+        d["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+        return d
+
+    @classmethod
+    def from_arrays(cls, d, decode: bool = True) -> "Corpus":
+        """
+        Rebuild a Corpus from the output of to_arrays (or anything that maps
+        the same keys to arrays, like an NpzFile).
+
+        Args:
+            d (dict-like of str -> np.ndarray): The arrays
+            decode (bool, default=True): Decode the string columns up front.
+                Otherwise strings are decoded from the heaps on access, which
+                saves memory but is slower.
+
+        Returns:
+            Corpus: The result
+        """
+        meta = json.loads(np.asarray(d["meta"]).tobytes().decode())
+        # np.asarray drops any np.memmap subclass without copying
+        # (stores written before has_sy existed don't have it)
+        cols = {k: np.asarray(d[k]) for k in cls._ARRAY_COLUMNS if k in d}
+        for k in cls._STRING_COLUMNS:
+            cols[k] = StringColumn(heap=d[k + "_heap"], offsets=d[k + "_offsets"])
+            if decode:
+                cols[k] = cols[k].decoded()
+        return cls(
+            cols["text"],
+            cols["sy"],
+            cols["wb"],
+            cols["mf"],
+            cols["line_offsets"],
+            cols["line_name"],
+            cols["metre"],
+            meta["metre_vocab"],
+            cols["pattern"],
+            meta["pattern_vocab"],
+            cols["feature"],
+            cols["div_offsets"],
+            cols["div_title"],
+            meta["author"],
+            meta["title"],
+            meta["source"],
+            cols.get("has_sy"),
+        )
+
+    # Array helpers for vectorised code
+
+    def words_per_line(self) -> np.ndarray:
+        return np.diff(self.line_offsets)
+
+    def word_lines(self) -> np.ndarray:
+        """Line index of every word."""
+        return np.repeat(np.arange(len(self)), self.words_per_line())
+
+    def line_divisions(self) -> np.ndarray:
+        """Division index of every line."""
+        return np.repeat(np.arange(self.n_divisions), np.diff(self.div_offsets))
+
+    def metres(self) -> np.ndarray:
+        """The metre of each line, as an array of strings."""
+        return np.array(self.metre_vocab, dtype=object)[self.metre]
+
+    def patterns(self) -> np.ndarray:
+        """The pattern of each line, as an array of strings."""
+        return np.array(self.pattern_vocab, dtype=object)[self.pattern]
+
+    @property
+    def n_words(self) -> int:
+        return int(self.line_offsets[-1])
+
+    @property
+    def n_divisions(self) -> int:
+        return len(self.div_offsets) - 1
+
+    # Sequence of lines, and soup lookalike
+
+    def __len__(self) -> int:
+        return len(self.line_offsets) - 1
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            return [CorpusLine(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Line index out of range")
+        return CorpusLine(self, i)
+
+    def __iter__(self) -> Iterator[CorpusLine]:
+        return (CorpusLine(self, i) for i in range(len(self)))
+
+    def find_all(self, name: str) -> list:
+        if name == "line":
+            return list(self)
+        if name == "division":
+            return [CorpusDivision(self, i) for i in range(self.n_divisions)]
+        if name == "word":
+            return [CorpusWord(self, i) for i in range(self.n_words)]
+        return []
+
+    def __call__(self, name: str) -> list:
+        return self.find_all(name)
+
+    def __repr__(self) -> str:
+        return "<Corpus %s - %s (%d divisions, %d lines, %d words)>" % (
+            self.author,
+            self.title,
+            self.n_divisions,
+            len(self),
+            self.n_words,
+        )
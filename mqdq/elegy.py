@@ -1,6 +1,7 @@
 from mqdq import line_analyzer as la
 from mqdq import rhyme_classes
 
+import numpy as np
 import pandas as pd
 import scipy as sp
 import copy
@@ -27,7 +28,10 @@ def metre_vectors(bab):
     if len(bab) % 2 != 0:
         raise ValueError("Error: Length of work (%d) is not even!" % len(bab))
 
-    df = pd.DataFrame(map(lambda l: la.binary_features(l), bab.raw_source))
+    # (in one pass, it's the same as la.binary_features per line)
+    df = pd.DataFrame(
+        la.feature_matrix(bab.raw_source, la.BINARY_FEATURES).astype(np.int64)
+    )
     # split into even and odd lines. Probably a slicker way to do this?
     even = df[df.index % 2 == 0]
     odd = df[df.index % 2 == 1]
@@ -88,8 +92,8 @@ def elegy_vector(bab):
 
     # Now do full-work features
 
-    elisions = [la.elision_count(l) for l in bab.raw_source]
-    chunked_feats["ELC"] = sum(elisions) / len(elisions)
+    elisions = la.feature_matrix(bab.raw_source, ["ELC"])[:, 0]
+    chunked_feats["ELC"] = int(elisions.sum()) / len(elisions)
     cl = copy.copy(bab._syl_source())
     cl.colorlink(config=VERTICAL_INIT)
     s = cl.score(config=rhyme_classes.LineSet.NEUTRAL)
@@ -99,7 +103,8 @@ def elegy_vector(bab):
     leo = cl.score(config=rhyme_classes.LineSet.NEUTRAL)
     chunked_feats["LEO"] = leo
     chunked_feats["LEN"] = len(cl)
-    pent_finals = [la.word_idx_syls(l, -1) for l in bab.raw_source if l["metre"] == "P"]
+    pents = [l for l in bab.raw_source if l["metre"] == "P"]
+    pent_finals = la.feature_matrix(pents, ["FWS"])[:, 0]
     chunked_feats["PFSD"] = sp.stats.tstd(pent_finals)
     return chunked_feats
 
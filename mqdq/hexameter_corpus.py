@@ -1,4 +1,3 @@
-from bs4 import BeautifulSoup
 from collections import Counter
 import re
 import numpy as np
@@ -6,6 +5,7 @@ import pandas as pd
 from mqdq import utils
 from mqdq import rhyme
 from mqdq import line_analyzer as la
+from mqdq import store
 import string
 import pathlib
 from tqdm import tqdm as tqdm_base
@@ -37,13 +37,13 @@ def geezit_corpus():
 	for auth,title,fn in tqdm(WORKS, file=sys.stdout, ncols=80):
 		
 		fn = pathlib.Path(__file__).parent / fn
-		with open(fn) as fh:
-			soup = BeautifulSoup(fh,"xml")
 
 		this_work=[]
-		for d_idx, d in enumerate(soup('division')):
-			ll = utils.clean(d('line'))
-			for l_idx, l in enumerate(ll):
+		# opens the memory-mapped store if it has been built (python -m
+		# mqdq.store), otherwise the on-disk cache after the first run
+		c = store.load(fn)
+		for d_idx, d in enumerate(c('division')):
+			for l_idx, l in enumerate(d('line')):
 				try:
 					ln = int(l['name'])
 				except ValueError:
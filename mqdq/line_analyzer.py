@@ -1,16 +1,188 @@
-import bs4
-from collections import Counter
+from collections import Counter, OrderedDict
+import functools
 import re
+import weakref
+from typing import Callable, NamedTuple, Optional
 import numpy as np
 import pandas as pd
 from mqdq import utils
 from mqdq import rhyme
+from mqdq import corpus
+from mqdq import cache
 
 DEFANCY = str.maketrans(
     {"ü": "y", "\u0304": None, "\u0303": None, "`": None, "_": None}
 )
 
 
+class Skeleton:
+    """The metrical facts about a line that the predicates below need, worked
+    out in one pass over the words' text, sy, wb and mf. Get them with
+    skeleton(l).
+
+    Per word, in line order:
+        text (str), sy (str or None), wb (str or None), mf (str or None)
+        syls (list of str): the syllables, eg ["1A", "1b", "1c", "2A"]
+
+    Per foot (keyed by the foot digit as a string), the index of the first
+    word that settles the question, plus the answer:
+        caesurae: see classify_caesura ("S", "W", "Q" or "-")
+        elisions: see elision_after_foot
+        arses: the first word containing the arsis of the foot
+        diaereses: see diaer_after_foot (only feet where there is one)
+    """
+
+    __slots__ = (
+        "text",
+        "sy",
+        "wb",
+        "mf",
+        "syls",
+        "caesurae",
+        "elisions",
+        "arses",
+        "diaereses",
+        "_broken",
+    )
+
+    def __init__(self, words):
+        # words is a list of (text, sy, wb, mf), one per word
+        self.text = tuple(w[0] for w in words)
+        self.sy = tuple(w[1] for w in words)
+        self.wb = tuple(w[2] for w in words)
+        self.mf = tuple(w[3] for w in words)
+        self.syls = []
+        self.caesurae, self.elisions, self.arses, self.diaereses = {}, {}, {}, {}
+        # a word with no sy is an error, but only if we get as far as it
+        self._broken = None
+
+        for i, (text, sy, wb, mf) in enumerate(words):
+            if sy is None:
+                if self._broken is None:
+                    self._broken = i
+                sy = ""
+            syls = [sy[j : j + 2] for j in range(0, len(sy) - 1, 2)]
+            self.syls.append(syls)
+            last = sy[-2:]
+            elided = mf == "SY"
+
+            theses = {x[0] for x in syls if x[1:] in ("T", "c")}
+            for f in theses:
+                self.elisions.setdefault(f, (i, elided))
+            for x in syls:
+                if x[1:] == "A":
+                    self.arses.setdefault(x[0], i)
+            if last[1:] in ("c", "T") and wb == "DI":
+                self.diaereses.setdefault(last[0], i)
+
+            # The syllable string ends with A, and there's a wordbreak, so
+            # that's a strong caesura (b, weak). Either one over an elision is
+            # Quasi. If we pass the end of the foot first, there's no caesura.
+            # (A half foot with no caesura is a scansion bug that can only
+            # happen in pentameters, but we'll catch it elsewhere.)
+            if last[1:] in ("A", "b"):
+                if wb is not None:
+                    self.caesurae.setdefault(
+                        last[0], (i, "S" if last[1] == "A" else "W")
+                    )
+                elif elided:
+                    self.caesurae.setdefault(last[0], (i, "Q"))
+            for f in theses:
+                self.caesurae.setdefault(f, (i, "-"))
+            for c in sy[::2]:
+                if "1" < c <= "9":
+                    self.caesurae.setdefault(str(int(c) - 1), (i, "-"))
+
+    def __len__(self):
+        return len(self.text)
+
+    def _settled(self, found):
+        # found is (word index, answer) or None. If there's a word with no sy
+        # before the one that settles it then the scan would have hit that
+        # first.
+        if self._broken is not None and (found is None or found[0] > self._broken):
+            raise KeyError("sy")
+        return found
+
+    def caesura(self, n, strict=False):
+        """See classify_caesura. None if nothing in the line settles it."""
+        found = self._settled(self.caesurae.get(str(n)))
+        if found is None:
+            return None
+        return "-" if strict and found[1] == "Q" else found[1]
+
+    def elision_after(self, n):
+        """See elision_after_foot."""
+        found = self._settled(self.elisions.get(str(n)))
+        return found[1] if found else False
+
+    def diaeresis_after(self, n):
+        """See diaer_after_foot."""
+        i = self.diaereses.get(str(n))
+        return self._settled(None if i is None else (i, True)) is not None
+
+    def arsis_word(self, n):
+        """Index of the first word containing the arsis of foot n, or None."""
+        i = self.arses.get(str(n))
+        found = self._settled(None if i is None else (i, i))
+        return None if found is None else i
+
+    def conflict(self, n):
+        """See conflict_in_foot. The line must have an arsis in foot n."""
+
+        # Not only does the stress need to fall on an Arsis, but it needs to
+        # fall on the arsis of the foot we're actually interested in.
+
+        # if a word has no stress, then the ictus is not stressed, so it's
+        # a conflict.
+        i = self.arsis_word(n)
+        if self.text[i].lower() in _UNACCENTED:
+            return True
+        stress = _stress_index(self.text[i], self.sy[i], self.mf[i])
+        return self.syls[i][stress] != "%dA" % n
+
+
+# line key -> (weakref to the owner of the line, Skeleton), most recent last
+_SKELETONS: OrderedDict = OrderedDict()
+_SKELETON_CACHE_SIZE = 4096
+
+
+def _line_key(l):
+    # CorpusLines are throwaway views, so key those by their corpus and index
+    if isinstance(l, corpus.CorpusLine):
+        return (id(l.corpus), l.index), l.corpus
+    return id(l), l
+
+
+def skeleton(l, rebuild=False):
+    """Get the Skeleton for a line. The most recently used few thousand are
+    cached, so all of the predicates in here can share one parse of the line.
+
+    Args:
+        l (bs4 <line>): The line
+        rebuild (bool): Reparse the line, eg after editing its words
+
+    Returns:
+        (Skeleton): The result
+    """
+
+    key, owner = _line_key(l)
+    hit = _SKELETONS.get(key)
+    if hit is not None and hit[0]() is owner and not rebuild:
+        _SKELETONS.move_to_end(key)
+        return hit[1]
+
+    sk = Skeleton([(w.text, w.get("sy"), w.get("wb"), w.get("mf")) for w in l("word")])
+    try:
+        _SKELETONS[key] = (weakref.ref(owner), sk)
+    except TypeError:
+        return sk  # can't track this kind of line, so just don't cache it
+    _SKELETONS.move_to_end(key)
+    if len(_SKELETONS) > _SKELETON_CACHE_SIZE:
+        _SKELETONS.popitem(last=False)
+    return sk
+
+
 def classify_caesura(l, n, strict=False):
     """Classify the caesura occurring in foot n.
 
@@ -27,30 +199,7 @@ def classify_caesura(l, n, strict=False):
         raise ValueError("Can't operate on a corrupt line!")
 
     try:
-        for w in l("word"):
-            # syllable string ends with A, and there's a wordbreak
-            # so this is a strong caesura
-            if re.search("%dA$" % n, w["sy"]) and w.has_attr("wb"):
-                return "S"
-            elif re.search("%db$" % n, w["sy"]) and w.has_attr("wb"):
-                return "W"
-            elif (
-                re.search("%d[Ab]$" % n, w["sy"])
-                and w.has_attr("mf")
-                and w["mf"] == "SY"
-            ):
-                if not strict:
-                    return "Q"
-                else:
-                    return "-"
-            elif re.search("%d[Tc]" % n, w["sy"]):
-                # we've passed the end of the foot in question
-                return "-"
-            elif re.search(f"{n+1}", w["sy"]):
-                # A half foot with no caesura. This is a scansion bug and can only happen in
-                # pentameters, but we'll catch it elsewhere.
-                return "-"
-            # FALL THROUGH ON PURPOSE
+        return skeleton(l).caesura(n, strict)
     except:
         raise ValueError("Can't handle this: %s" % l)
 
@@ -70,14 +219,7 @@ def elision_after_foot(n, l):
         raise ValueError("Can't operate on a corrupt line!")
 
     try:
-        for w in l("word"):
-            if re.search("%d[Tc]" % n, w["sy"]):
-                if w.has_attr("mf") and w["mf"] == "SY":
-                    return True
-                return False
-
-        return False
-
+        return skeleton(l).elision_after(n)
     except:
         raise ValueError("Can't handle this: %s" % l)
 
@@ -162,14 +304,7 @@ def diaer_after_foot(n, l):
         # So, if the word has a 'DI' word boundary, and its
         # syllables _end_ with the thesis of the given foot
         # (4T for spondee, 4c for dactyl) then we should be done
-        for w in l("word"):
-            if (
-                re.search("%d[cT]$" % n, w["sy"])
-                and w.has_attr("wb")
-                and w["wb"] == "DI"
-            ):
-                return True
-        return False
+        return skeleton(l).diaeresis_after(n)
     except:
         raise ValueError("Error processing: %s" % l)
 
@@ -194,24 +329,46 @@ def has_bd(line):
 
 
 def _get_syls_with_stress(w):
-    if w["sy"] == "":
+    return _syls_with_stress(w.text, w["sy"], w.get("mf"))
+
+
+def _syls_with_stress(text, sy, mf):
+    if sy == "":
         return "_"
-    if len(w["sy"]) <= 2 and not _has_elision(w):
-        return w["sy"]
-    if w.text.lower() in _UNACCENTED:
-        return w["sy"]
-    syls = re.findall("..", w["sy"])
-    stress = _stressed(w)
+    stress = _stressed_syl(text, sy, mf)
+    if stress is None:
+        return sy
+    syls = re.findall("..", sy)
     syls[stress] = "`" + syls[stress]
     return "".join(syls)
 
 
+def _stressed_syl(text, sy, mf):
+    # index of the syllable in sy that carries the accent, or None if the
+    # word is unaccented (or has no syllables)
+    if sy == "":
+        return None
+    if len(sy) <= 2 and not mf == "SY":
+        return None
+    if text.lower() in _UNACCENTED:
+        return None
+    return _stress_index(text, sy, mf)
+
+
 def _stressed(w):
+    return _stress_index(w.text, w["sy"], w.get("mf"))
 
-    if w.text.lower() in _ACCENT_LAST_FOOT:
+
+# The same few thousand (text, sy, mf) combinations make up most of a work,
+# and every harmony, scansion and phonetification asks for their stress, so
+# remember the answers.
+@functools.lru_cache(maxsize=1 << 16)
+def _stress_index(text, sy, mf):
+
+    if text.lower() in _ACCENT_LAST_FOOT:
         return -1
 
-    syls = re.findall("..", w["sy"])
+    syls = re.findall("..", sy)
 
     # For words with elision and a long syllable ending, I assume the stress
     # stayed on that syllable. This is based on analysing lots of hexameter poetry.
@@ -227,7 +384,7 @@ def _stressed(w):
     #
     # There's a pretty good chance that 1A is _not_ stressed
 
-    if _has_elision(w) and re.match(".[ATX]", syls[-1]):
+    if mf == "SY" and re.match(".[ATX]", syls[-1]):
         return -1
 
     # For words ending with a short syllable, though, we ignore
@@ -257,6 +414,21 @@ def _stressed(w):
             return -3
 
 
+def stress_cache_info():
+    """Hit and miss counts for the cache of word stress results.
+
+    Returns:
+        (functools._CacheInfo): hits, misses, maxsize, currsize
+    """
+
+    return _stress_index.cache_info()
+
+
+def stress_cache_clear():
+    """Empty the cache of word stress results (and zero the counts)."""
+    _stress_index.cache_clear()
+
+
 # cf Allen, Vox Latina (1965), 87-8
 _UNACCENTED = {
     "at",
@@ -274,26 +446,6 @@ _UNACCENTED = {
 _ACCENT_LAST_FOOT = {"nostras", "illic", "adhuc", "tanton", "adduc"}
 
 
-def _conflict(w, foot):
-
-    # Not only does the stress need to fall on an Arsis, but it needs to
-    # fall on the arsis of the foot we're actually interested in.
-
-    # if a word has no stress, then the ictus is not stressed, so it's
-    # a conflict.
-    if w.text.lower() in _UNACCENTED:
-        return True
-
-    syls = re.findall("..", w["sy"])
-    if len(w["sy"]) == 0:
-        raise ValueError("No syllables?")
-
-    # A means arsis, which is the start of either a spondee or dactyl
-    if syls[_stressed(w)] == ("%dA" % foot):
-        return False
-    return True
-
-
 def _has_elision(w):
     # SY for synalepha
     return w.has_attr("mf") and w["mf"] == "SY"
@@ -345,13 +497,11 @@ def conflict_in_foot(n, l):
     if l["pattern"] == "corrupt":
         raise ValueError("Can't operate on a corrupt line!")
 
-    containing_word = next(
-        (w for w in l("word") if re.search("%dA" % n, w["sy"])), None
-    )
-    if not containing_word:
+    sk = skeleton(l)
+    if sk.arsis_word(n) is None:
         raise ValueError("No arsis for syllable %d in line?? %s" % (n, l))
 
-    return _conflict(containing_word, n)
+    return sk.conflict(n)
 
 
 def predictors_by_foot(l):
@@ -546,8 +696,743 @@ BINARY_FEATURES = [
 ]
 ALL_FEATURES = BINARY_FEATURES + ["ELC"]
 
+# Batch feature extraction.
+#
+# binary_features runs every predicate over every line, which is what makes
+# distribution() slow on big corpora. Instead, the features are computed for
+# all the lines at once, from a registry (FEATURES) of extractors that each
+# declare what they need: every sy string is split into one (foot, position)
+# token per syllable, once, and the "caesurae" stage (say) works out the
+# caesura in every foot of every line from that, which all eight of the SC and
+# WC features then share. Only the features that are asked for, and the
+# stages they need, are computed. The rules mirror the scalar functions
+# exactly (classify_caesura, diaer_after_foot, conflict_in_foot, _stressed,
+# elision_count). Lines that a stage can't vouch for (odd sy strings, corrupt
+# patterns, scansion errors...) are flagged, and the features that depend on
+# that stage fall back to the line at a time code for those lines, so the
+# results, and the errors, are the same.
+
+_SYL_CODES = np.zeros(256, dtype=np.uint8)
+for _i, _c in enumerate("AbcTX", start=1):
+    _SYL_CODES[ord(_c)] = _i
+_SYL_A, _SYL_B, _SYL_C, _SYL_T, _SYL_X = range(1, 6)
+# caesura codes, index into this string
+_CAESURAE = "?SWQ-"
+
+
+class Feature(NamedTuple):
+    """An entry in the FEATURES registry. Add your own with register_feature.
+
+    extract (callable): Takes a FeatureBatch and returns one value per line
+        (for a feature), or whatever it likes (for a stage). It can use the
+        results of the entries it needs as batch[name].
+    needs (tuple of str): The entries that this one uses
+    line (callable, optional): Takes a single line and returns its value.
+        Used for any lines that one of the entries in needs flagged as beyond
+        the batch code (see FeatureBatch.flag). A feature without one raises
+        ValueError for flagged lines, unless everything flagging them has a
+        fallback of its own (eg a feature built from other features).
+    stage (bool): An intermediate result, not a feature in its own right
+    """
+
+    extract: Callable
+    needs: tuple = ()
+    line: Optional[Callable] = None
+    stage: bool = False
+
+
+class LineSlot(NamedTuple):
+    """A line fallback that is one element of what fn returns for the line (eg
+    one of binary_features). A FeatureBatch calls fn at most once per line,
+    however many of the features it fills in."""
+
+    fn: Callable
+    index: int
+
+    def __call__(self, l):
+        return self.fn(l)[self.index]
+
 
-def chunked_features(ll, n=None, feats=ALL_FEATURES) -> pd.DataFrame:
+FEATURES: dict = {}
+
+
+def register_feature(name, extract, needs=(), line=None, stage=False):
+    """Add a feature (or a stage) to the registry, replacing any existing entry
+    of that name. The feature can then be used in the feats argument to
+    chunked_features, distribution and friends.
+
+    Eg a feature for lines with a strong caesura in the third foot and no
+    diaeresis after the fourth, built from the existing stages:
+
+        la.register_feature(
+            "3SC!4DI",
+            lambda b: (b["3SC"] == 1) & (b["4DI"] == 0),
+            needs=("3SC", "4DI"),
+        )
+
+    Args:
+        name (str): The name of the feature
+        extract (callable): See Feature
+        needs (iterable of str): See Feature
+        line (callable, optional): See Feature
+        stage (bool): See Feature
+    """
+
+    needs = tuple(needs)
+    for dep in needs:
+        if dep not in FEATURES:
+            raise ValueError("Unknown dependency %s for %s" % (dep, name))
+    FEATURES[name] = Feature(extract, needs, line, stage)
+
+
+class FeatureBatch:
+    """A set of lines being featurised, and everything worked out about them
+    so far. batch[name] computes a FEATURES entry (and what it needs) at most
+    once.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+    """
+
+    def __init__(self, ll):
+        self.ll = ll
+        self.n_lines = len(ll)
+        # entry name -> bool array of the lines it flagged
+        self.invalid: dict = {}
+        self._done: dict = {}
+        # (LineSlot fn, line index) -> fn of that line
+        self._line_done: dict = {}
+
+    def __getitem__(self, name):
+        if name not in self._done:
+            f = FEATURES[name]
+            for dep in f.needs:
+                self[dep]
+            res = f.extract(self)
+            if f.stage:
+                pass
+            elif f.line is not None:
+                bad = np.flatnonzero(self.invalid_lines(name))
+                if len(bad):
+                    res = np.array(res)
+                    for i in bad:
+                        res[i] = self._line_value(f.line, i)
+            elif self.unresolved_lines(name).any():
+                raise ValueError(
+                    "%d lines need the per line code for %s, but it has none"
+                    % (self.unresolved_lines(name).sum(), name)
+                )
+            self._done[name] = res
+        return self._done[name]
+
+    def _line_value(self, line, i):
+        if not isinstance(line, LineSlot):
+            return line(self.ll[i])
+        key = (line.fn, i)
+        if key not in self._line_done:
+            self._line_done[key] = line.fn(self.ll[i])
+        return self._line_done[key][line.index]
+
+    def flag(self, name, mask):
+        """Mark some lines as beyond the batch code for an entry.
+
+        Args:
+            name (str): The entry
+            mask (numpy.ndarray): bool, one per line
+        """
+
+        self.invalid[name] = self.invalid.get(name, False) | mask
+
+    def invalid_lines(self, name):
+        """The lines flagged by an entry, or by anything it needs, directly or
+        indirectly.
+
+        Returns:
+            (numpy.ndarray): bool, one per line
+        """
+
+        res = np.zeros(self.n_lines, dtype=bool)
+        seen, todo = set(), [name]
+        while todo:
+            n = todo.pop()
+            if n not in seen:
+                seen.add(n)
+                res |= self.invalid.get(n, False)
+                todo.extend(FEATURES[n].needs)
+        return res
+
+    def unresolved_lines(self, name):
+        """As invalid_lines, but leaving out what comes through features with
+        a per line fallback, since their values for those lines are already
+        right.
+
+        Returns:
+            (numpy.ndarray): bool, one per line
+        """
+
+        res = np.zeros(self.n_lines, dtype=bool)
+        seen, todo = set(), [name]
+        while todo:
+            n = todo.pop()
+            if n in seen:
+                continue
+            seen.add(n)
+            f = FEATURES[n]
+            if n != name and not f.stage and f.line is not None:
+                continue
+            res |= self.invalid.get(n, False)
+            todo.extend(f.needs)
+        return res
+
+
+def _word_columns(ll):
+    # Returns sy and text (lists of str), has_wb, di, elided and prodelided
+    # (bool arrays), all per word, plus the word offsets of each line and the metre
+    # and pattern of each line. Lines with words that have no sy at all are
+    # flagged in the no_sy array.
+    if isinstance(ll, corpus.Corpus):
+        c, idx = ll, None
+    else:
+        c = ll[0].corpus if ll and isinstance(ll[0], corpus.CorpusLine) else None
+        if c is not None and all(
+            isinstance(l, corpus.CorpusLine) and l.corpus is c for l in ll
+        ):
+            idx = np.array([l.index for l in ll], dtype=np.int64)
+        else:
+            c = None
+
+    if c is not None:
+        # straight from the columns, no word views at all
+        o = np.asarray(c.line_offsets)
+        if idx is None:
+            widx, offsets = slice(None), o
+        else:
+            counts = o[idx + 1] - o[idx]
+            offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            widx = np.repeat(o[idx] - offsets[:-1], counts) + np.arange(offsets[-1])
+        sy, text = c.sy.tolist(), c.text.tolist()
+        if idx is not None:
+            sy, text = [sy[i] for i in widx.tolist()], [text[i] for i in widx.tolist()]
+        wb, mf = np.asarray(c.wb)[widx], np.asarray(c.mf)[widx]
+        lines = slice(None) if idx is None else idx
+        return dict(
+            sy=sy,
+            text=text,
+            has_wb=wb != 0,
+            di=wb == corpus.WB_CODE["DI"],
+            elided=mf == corpus.MF_CODE["SY"],
+            prodelided=mf == corpus.MF_CODE["PE"],
+            offsets=offsets,
+            metre=c.metres()[lines].tolist(),
+            pattern=c.patterns()[lines].tolist(),
+            no_sy=np.zeros(len(offsets) - 1, dtype=bool),
+        )
+
+    sy, text, has_wb, di, elided, prodelided = [], [], [], [], [], []
+    offsets, metre, pattern, no_sy = [0], [], [], []
+    for l in ll:
+        broken = False
+        for w in l("word"):
+            s = w.get("sy")
+            if s is None:
+                s, broken = "", True
+            sy.append(s)
+            text.append(w.text)
+            wb = w.get("wb")
+            has_wb.append(wb is not None)
+            di.append(wb == "DI")
+            elided.append(w.get("mf") == "SY")
+            prodelided.append(w.get("mf") == "PE")
+        offsets.append(len(sy))
+        metre.append(l.get("metre"))
+        pattern.append(l.get("pattern"))
+        no_sy.append(broken)
+    return dict(
+        sy=sy,
+        text=text,
+        has_wb=np.array(has_wb, dtype=bool),
+        di=np.array(di, dtype=bool),
+        elided=np.array(elided, dtype=bool),
+        prodelided=np.array(prodelided, dtype=bool),
+        offsets=np.array(offsets, dtype=np.int64),
+        metre=metre,
+        pattern=pattern,
+        no_sy=np.array(no_sy, dtype=bool),
+    )
+
+
+def _first_per_line(line_of, mask, values, n_lines, empty=0):
+    # For each line, the value at the first position where mask is set (or
+    # empty, if there isn't one). Positions are in document order.
+    res = np.full(n_lines, empty, dtype=values.dtype)
+    hit_lines = line_of[mask]
+    uniq, first = np.unique(hit_lines, return_index=True)
+    res[uniq] = values[mask][first]
+    return res
+
+
+def _words_stage(b):
+    w = _word_columns(b.ll)
+    w["wline"] = np.repeat(np.arange(b.n_lines), np.diff(w["offsets"]))
+    return w
+
+
+def _lines_stage(b):
+    metre = b["words"]["metre"]
+    hexameter = np.array([mt == "H" for mt in metre], dtype=bool)
+    pentameter = np.array([mt == "P" for mt in metre], dtype=bool)
+    corrupt = np.array([p == "corrupt" for p in b["words"]["pattern"]], dtype=bool)
+    b.flag("lines", ~(hexameter | pentameter) | corrupt)
+    return dict(hexameter=hexameter, pentameter=pentameter)
+
+
+def _tokens_stage(b):
+    # the token table: foot, position, word, line for every syllable
+    w = b["words"]
+    sy, wline = w["sy"], w["wline"]
+    n_words = len(sy)
+    b.flag("tokens", w["no_sy"])
+    lens = np.fromiter(map(len, sy), dtype=np.int64, count=n_words)
+    joined = "".join(sy)
+    if len(joined) % 2 or not joined.isascii():
+        # something is malformed somewhere, find the lines
+        odd = (lens % 2 == 1) | ~np.fromiter(
+            (s.isascii() for s in sy), dtype=bool, count=n_words
+        )
+        b.flag("tokens", np.isin(np.arange(b.n_lines), wline[odd]))
+        sy = [s if ok else "" for s, ok in zip(sy, ~odd)]
+        lens[odd] = 0
+        joined = "".join(sy)
+
+    raw = np.frombuffer(joined.encode("ascii"), dtype=np.uint8).reshape(-1, 2)
+    # plus one dummy token at the end, so that the index arithmetic below
+    # never has to worry about words with no syllables
+    foot = np.append(raw[:, 0].astype(np.int64) - ord("0"), 0)
+    pos = np.append(_SYL_CODES[raw[:, 1]], 0)
+    nsyl = lens // 2
+    tword = np.repeat(np.arange(n_words), nsyl)
+    malformed = (foot[:-1] < 1) | (foot[:-1] > 6) | (pos[:-1] == 0)
+    if malformed.any():
+        b.flag("tokens", np.isin(np.arange(b.n_lines), wline[tword[malformed]]))
+        foot[:-1][malformed], pos[:-1][malformed] = 0, 0
+
+    start = np.zeros(n_words + 1, dtype=np.int64)
+    np.cumsum(nsyl, out=start[1:])
+    has_syls = nsyl > 0
+    last = np.where(has_syls, start[1:] - 1, 0)
+
+    # per word, which feet it has any syllable in, and which theses
+    in_foot = np.zeros((n_words, 8), dtype=bool)
+    in_foot[tword, foot[:-1]] = True
+    thesis = np.zeros((n_words, 8), dtype=bool)
+    th = np.isin(pos[:-1], (_SYL_T, _SYL_C))
+    thesis[tword[th], foot[:-1][th]] = True
+
+    return dict(
+        foot=foot,
+        pos=pos,
+        tword=tword,
+        nsyl=nsyl,
+        start=start,
+        has_syls=has_syls,
+        last=last,
+        last_foot=np.where(has_syls, foot[last], 0),
+        last_pos=np.where(has_syls, pos[last], 0),
+        in_foot=in_foot,
+        thesis=thesis,
+    )
+
+
+def _spondees_stage(b):
+    # from the patterns, once per distinct pattern
+    w = b["words"]
+    spondees: dict = {}
+    res = np.zeros((b.n_lines, 4), dtype=np.uint8)
+    bad = np.zeros(b.n_lines, dtype=bool)
+    for i, key in enumerate(zip(w["metre"], w["pattern"])):
+        if key not in spondees:
+            mt, p = key
+            if p is None or p == "corrupt":
+                spondees[key] = None
+            else:
+                fs = p[:4] if mt == "H" else [c for c in p if c in VALID_FEET][:4]
+                spondees[key] = (
+                    [1 if c == "S" else 0 for c in fs] if len(fs) == 4 else None
+                )
+        if spondees[key] is None:
+            bad[i] = True
+        else:
+            res[i] = spondees[key]
+    b.flag("spondees", bad)
+    return res
+
+
+def _stress_stage(b):
+    # The foot of the stressed syllable of every word, if that syllable is an
+    # arsis, else 0 (see _stressed)
+    w, t = b["words"], b["tokens"]
+    text, elided = w["text"], w["elided"]
+    foot, pos, nsyl, start, last = t["foot"], t["pos"], t["nsyl"], t["start"], t["last"]
+    lowered = [x.lower() for x in text]
+    accent_last = np.fromiter(
+        (x in _ACCENT_LAST_FOOT for x in lowered), dtype=bool, count=len(text)
+    )
+    is_long = np.isin(pos, (_SYL_A, _SYL_T, _SYL_X))
+    penult_long = np.where(nsyl >= 2, is_long[np.maximum(last - 1, 0)], False)
+    stress = np.where(nsyl >= 3, np.where(penult_long, last - 1, last - 2), start[:-1])
+    stress = np.where(
+        accent_last | (elided & is_long[last] & t["has_syls"]), last, stress
+    )
+    return dict(
+        arsis=np.where(t["has_syls"] & (pos[stress] == _SYL_A), foot[stress], 0),
+        unaccented=np.fromiter(
+            (x in _UNACCENTED for x in lowered), dtype=bool, count=len(text)
+        ),
+    )
+
+
+def _conflicts_stage(b):
+    # conflict_in_foot: the first word with an nA, stressed elsewhere
+    w, t, st, ln = b["words"], b["tokens"], b["stress"], b["lines"]
+    wline, tword = w["wline"], t["tword"]
+    n_words = len(w["sy"])
+    res = np.zeros((b.n_lines, 6), dtype=np.uint8)
+    found = np.zeros((b.n_lines, 6), dtype=bool)
+    for n in range(1, 6):
+        has_arsis = (t["foot"][:-1] == n) & (t["pos"][:-1] == _SYL_A)
+        word_has_arsis = np.zeros(n_words, dtype=bool)
+        word_has_arsis[tword[has_arsis]] = True
+        i = _first_per_line(wline, word_has_arsis, np.arange(n_words), b.n_lines, -1)
+        found[:, n] = i >= 0
+        i = i[found[:, n]]
+        res[found[:, n], n] = st["unaccented"][i] | (st["arsis"][i] != n)
+    # harmony would raise for these, so let it
+    b.flag(
+        "conflicts",
+        (ln["hexameter"] & ~found[:, 1:5].all(axis=1))
+        | (ln["pentameter"] & ~found[:, 1:6].all(axis=1)),
+    )
+    return res
+
+
+def _diaereses_stage(b):
+    # diaer_after_foot: a DI word ending on the thesis of foot n
+    w, t = b["words"], b["tokens"]
+    res = np.zeros((b.n_lines, 6), dtype=np.uint8)
+    for n in range(1, 6):
+        ends_thesis = (t["last_foot"] == n) & np.isin(t["last_pos"], (_SYL_C, _SYL_T))
+        res[np.unique(w["wline"][ends_thesis & w["di"]]), n] = 1
+    return res
+
+
+def _caesurae_stage(b):
+    # classify_caesura: the first word that decides it, in priority order
+    w, t, ln = b["words"], b["tokens"], b["lines"]
+    last_foot, last_pos, has_wb = t["last_foot"], t["last_pos"], w["has_wb"]
+    res = np.zeros((b.n_lines, 6), dtype=np.uint8)
+    for n in range(1, 6):
+        ends_here = last_foot == n
+        code = np.select(
+            [
+                ends_here & (last_pos == _SYL_A) & has_wb,
+                ends_here & (last_pos == _SYL_B) & has_wb,
+                ends_here & np.isin(last_pos, (_SYL_A, _SYL_B)) & w["elided"],
+                t["thesis"][:, n] | t["in_foot"][:, n + 1],
+            ],
+            [1, 2, 3, 4],
+            0,
+        ).astype(np.uint8)
+        res[:, n] = _first_per_line(w["wline"], code > 0, code, b.n_lines)
+    # caesurae would raise for these (or give a broken pentameter), so let it
+    b.flag(
+        "caesurae",
+        (ln["hexameter"] & (res[:, 1:5] == 0).any(axis=1))
+        | (ln["pentameter"] & (res[:, 1:6] == 0).any(axis=1))
+        | (ln["pentameter"] & (res[:, 3] == _CAESURAE.index("-"))),
+    )
+    return res
+
+
+def _feet_stage(b):
+    # the feet that the four columns of each feature group refer to. For
+    # pentameters the half foot is skipped.
+    return np.where(b["lines"]["pentameter"][:, None], [1, 2, 4, 5], [1, 2, 3, 4])
+
+
+def _by_foot(stage, k, value=None):
+    # column k of a feature group, from a per foot stage
+    def extract(b):
+        res = b[stage][np.arange(b.n_lines), b["feet"][:, k]]
+        if value is not None:
+            res = res == _CAESURAE.index(value)
+        return res.astype(np.uint8)
+
+    return extract
+
+
+def _spondee(k):
+    return lambda b: b["spondees"][:, k]
+
+
+def _binary_feature(name):
+    # the per line fallback for one of the BINARY_FEATURES
+    return LineSlot(binary_features, BINARY_FEATURES.index(name))
+
+
+register_feature("words", _words_stage, stage=True)
+register_feature("lines", _lines_stage, ("words",), stage=True)
+register_feature("tokens", _tokens_stage, ("words",), stage=True)
+register_feature("feet", _feet_stage, ("lines",), stage=True)
+register_feature("spondees", _spondees_stage, ("lines",), stage=True)
+register_feature("stress", _stress_stage, ("words", "tokens"), stage=True)
+register_feature(
+    "conflicts", _conflicts_stage, ("words", "tokens", "stress", "lines"), stage=True
+)
+register_feature("diaereses", _diaereses_stage, ("words", "tokens"), stage=True)
+register_feature("caesurae", _caesurae_stage, ("words", "tokens", "lines"), stage=True)
+
+for _k in range(4):
+    for _name, _extract, _needs in [
+        ("SP", _spondee(_k), ("spondees",)),
+        ("CF", _by_foot("conflicts", _k), ("conflicts", "feet")),
+        ("DI", _by_foot("diaereses", _k), ("diaereses", "feet")),
+        ("SC", _by_foot("caesurae", _k, "S"), ("caesurae", "feet")),
+        ("WC", _by_foot("caesurae", _k, "W"), ("caesurae", "feet")),
+    ]:
+        _name = "%d%s" % (_k + 1, _name)
+        register_feature(_name, _extract, _needs, _binary_feature(_name))
+register_feature(
+    "ELC",
+    lambda b: np.bincount(
+        b["words"]["wline"], weights=b["words"]["elided"], minlength=b.n_lines
+    ).astype(np.uint8),
+    ("words",),
+    lambda l: elision_count(l),
+)
+
+
+def _foot_string(stage, chars):
+    # a per foot stage as a four character string (over the same feet as the
+    # binary features), eg "SWS-"
+    def extract(b):
+        codes = b[stage][np.arange(b.n_lines)[:, None], b["feet"]]
+        return np.array(list(chars))[codes].view("<U4").ravel()
+
+    return extract
+
+
+def _metre_string(hexameter, pentameter):
+    # the per line fallback for a _foot_string feature
+    def line(l):
+        if l["metre"] == "H":
+            return "".join(hexameter(l))
+        elif l["metre"] == "P":
+            return "".join(pentameter(l))
+        raise ValueError("Unknown metre type %s" % l["metre"])
+
+    return line
+
+
+# These are not in ALL_FEATURES, but they can be asked for by name.
+register_feature(
+    "CAES",
+    _foot_string("caesurae", _CAESURAE),
+    ("caesurae", "feet"),
+    _metre_string(lambda l: caesurae(l, start=1, end=4), _pent_caesurae),
+)
+register_feature(
+    "HARM",
+    _foot_string("conflicts", "HC"),
+    ("conflicts", "feet"),
+    _metre_string(lambda l: harmony(l), _pent_harmony),
+)
+
+
+_MAX_ELISION_CHAIN = 4
+
+
+def _word_syls(b, idx):
+    # word_idx_syls for every line at once: from word idx, follow prodelision
+    # back and elision forward until there's a word with syllables. Returns
+    # the counts, and the lines to leave to word_idx_syls (it raises for
+    # them, unless the chain of elisions is just unusually long).
+    w = b["words"]
+    o, n_words = w["offsets"], len(w["sy"])
+    lens = np.fromiter(map(len, w["sy"]), dtype=np.int64, count=n_words)
+    res = np.full(b.n_lines, np.nan)
+    bad = w["no_sy"].copy()
+
+    if idx == "mid":
+        # the first word ending on the third foot caesura (always has syls)
+        ends = np.fromiter(
+            (s[-2:] in ("3A", "3b") for s in w["sy"]), dtype=bool, count=n_words
+        )
+        j = _first_per_line(w["wline"], ends, np.arange(n_words), b.n_lines, -1)
+        res[j >= 0] = lens[j[j >= 0]] / 2
+        return res, np.zeros(b.n_lines, dtype=bool)
+
+    n = np.diff(o)
+    rel = np.full(b.n_lines, idx, dtype=np.int64)  # idx, as the recursion sees it
+    todo = np.flatnonzero(~bad)
+    for _ in range(_MAX_ELISION_CHAIN):
+        pos = np.where(rel[todo] < 0, n[todo] + rel[todo], rel[todo])
+        ok = (pos >= 0) & (pos < n[todo])
+        bad[todo[~ok]] = True
+        i = todo[ok]
+        j = o[i] + pos[ok]
+        has_syls = lens[j] > 0
+        res[i[has_syls]] = lens[j[has_syls]] / 2
+        i, j = i[~has_syls], j[~has_syls]
+        back = w["prodelided"][j] & (rel[i] != 0)
+        fwd = w["elided"][j] & (rel[i] != -1)
+        bad[i[~(back | fwd)]] = True
+        rel[i[back]] -= 1
+        rel[i[fwd]] += 1
+        todo = i[back | fwd]
+    bad[todo] = True
+    return res, bad
+
+
+def _midword_idx(l):
+    # as rhyme_classes.Line.midword_idx
+    for i, w in enumerate(l("word")):
+        if (w.get("sy") or "").endswith(("3A", "3b")):
+            return i
+    return None
+
+
+def _line_word_syls(l, idx):
+    if idx == "mid":
+        i = _midword_idx(l)
+        return np.nan if i is None else word_idx_syls(l, i)
+    return word_idx_syls(l, idx)
+
+
+def _word_syls_feature(name, idx):
+    def extract(b):
+        res, bad = _word_syls(b, idx)
+        b.flag(name, bad)
+        return res
+
+    return extract
+
+
+# Syllables in the initial, mid (see word_syls), penultimate and final words
+for _name, _idx in [("IWS", 0), ("MWS", "mid"), ("PWS", -2), ("FWS", -1)]:
+    register_feature(
+        _name,
+        _word_syls_feature(_name, _idx),
+        ("words",),
+        functools.partial(_line_word_syls, idx=_idx),
+    )
+
+# The entries as shipped. Only these are kept in the on disk feature cache
+# (see cache.line_features), since anything registered later could change.
+_BUILTIN_FEATURES = dict(FEATURES)
+
+
+def cacheable(name):
+    """Can the values of this feature be kept in the on disk feature cache?
+    True for the features that ship with the library, unless they (or any
+    stage or feature they depend on, however indirectly) have been replaced
+    with register_feature.
+
+    Args:
+        name (str): The feature
+
+    Returns:
+        (bool): The result
+    """
+
+    f = FEATURES.get(name)
+    if f is None or f.stage:
+        return False
+    todo, seen = [name], set()
+    while todo:
+        dep = todo.pop()
+        if dep in seen:
+            continue
+        seen.add(dep)
+        f = FEATURES.get(dep)
+        if f is None or f is not _BUILTIN_FEATURES.get(dep):
+            return False
+        todo.extend(f.needs)
+    return True
+
+
+def check_features(feats):
+    """Raise KeyError if any of feats isn't a registered feature."""
+    for name in feats:
+        if name not in FEATURES or FEATURES[name].stage:
+            raise KeyError("Unknown feature %s" % name)
+
+
+def feature_columns(ll, feats=ALL_FEATURES) -> dict:
+    """As feature_matrix, but returns each feature as its own column, in its
+    own dtype, so text features (eg CAES, HARM) can be mixed with numeric
+    ones.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        feats (list of str): Features to compute, from FEATURES
+
+    Returns:
+        (dict): feature -> numpy.ndarray, one value per line
+    """
+
+    check_features(feats)
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    if len(ll) == 0:
+        return {name: np.zeros(0, dtype=np.uint8) for name in feats}
+
+    b = FeatureBatch(ll)
+    return {name: b[name] for name in feats}
+
+
+def _stack_columns(cols, feats, n_lines):
+
+    # np.column_stack would quietly turn every column into text if any of
+    # them is, so refuse to mix the two
+    text = [name for name in feats if cols[name].dtype.kind in "OSU"]
+    if text and len(text) < len(feats):
+        raise ValueError(
+            "Can't put text features (%s) in one matrix with numeric ones, "
+            "use feature_columns (or cache.line_feature_columns) instead"
+            % ", ".join(text)
+        )
+    if not feats:
+        return np.zeros((n_lines, 0), dtype=np.uint8)
+    return np.column_stack([cols[name] for name in feats])
+
+
+def feature_matrix(ll, feats=ALL_FEATURES) -> np.ndarray:
+    """Compute some features (by default the BINARY_FEATURES plus ELC) for
+    every line in one pass. This gives the same values as binary_features and
+    elision_count, line by line, but works over the whole set at once, so it is
+    much faster on big corpora (and fastest of all on a corpus.Corpus, or lines
+    from one). Only the requested features, and what they need, are computed.
+
+    Text features (eg CAES, HARM) can only be stacked with other text
+    features (ValueError otherwise), to mix them with numeric ones use
+    feature_columns.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        feats (list of str): Features to compute, from FEATURES
+
+    Returns:
+        (numpy.ndarray): One row per line, with one column per feature (uint8,
+                         unless any registered features return something else)
+    """
+
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    return _stack_columns(feature_columns(ll, feats), feats, len(ll))
+
+
+def chunked_features(ll, n=None, feats=ALL_FEATURES, cached=False) -> pd.DataFrame:
     """Take a set of binary features per line, and return a chunked average.
 
     Eg if the feature was F1S (first foot spondee), every line would be given
@@ -558,9 +1443,18 @@ def chunked_features(ll, n=None, feats=ALL_FEATURES) -> pd.DataFrame:
         calculated, but the variance might be high. It's up to the user to drop that
         chunk, if this is a problem.
 
+    Text features (eg CAES, HARM) can't be averaged, so asking for one raises
+    ValueError (use feature_columns or cache.line_feature_columns for those).
+
     Args:
         ll (list of bs4 <line>s): Lines to operate on
         n (int): chunk size (1 .. len(ll))
+        feats (list of str): Features to compute (see FEATURES). Only these
+            (and whatever they depend on) are computed.
+        cached (bool): Use (and fill) the on disk feature cache, so lines that
+            have been seen before aren't featurised again (see
+            cache.line_features). This writes files to
+            cache.default_cache_dir() ($MQDQ_CACHE_DIR, or ~/.cache/mqdq).
 
     Returns:
         (pandas.DataFrame): The results, one per row, with a header row
@@ -569,7 +1463,7 @@ def chunked_features(ll, n=None, feats=ALL_FEATURES) -> pd.DataFrame:
 
     # if they give us just one line instead of wrapping it
     # in a list as they should then be nice to them
-    if ll.__class__ == bs4.element.Tag:
+    if getattr(ll, "name", None) == "line":
         ll = [ll]
 
     if n and n > len(ll):
@@ -577,11 +1471,19 @@ def chunked_features(ll, n=None, feats=ALL_FEATURES) -> pd.DataFrame:
     if not n:
         n = len(ll)
 
-    # TODO rewrite map as list comp and test
-    df = pd.DataFrame(map(lambda l: binary_features(l), ll), columns=BINARY_FEATURES)  # type: ignore
-    if "ELC" in feats:
-        df["ELC"] = [elision_count(l) for l in ll]
-    return _chunk_mean(df[feats], n)
+    if cached:
+        cols = cache.line_feature_columns(ll, feats)
+    else:
+        cols = feature_columns(ll, feats)
+    # column by column, so each keeps its own dtype
+    df = pd.DataFrame(index=range(len(ll)))
+    for i, name in enumerate(feats):
+        col = cols[name]
+        if col.dtype.kind not in "biuf":
+            raise ValueError("%s is not a numeric feature, it can't be averaged" % name)
+        df[i] = col.astype(np.int64) if col.dtype.kind in "biu" else col
+    df.columns = list(feats)
+    return _chunk_mean(df, n)
 
 
 def elision_count(l):
@@ -597,37 +1499,265 @@ def elision_count(l):
     return sum([(1 if _has_elision(w) else 0) for w in l("word")])
 
 
-def distribution(ll, feats=ALL_FEATURES):
+def distribution(ll, feats=ALL_FEATURES, cached=False):
     """Transforms the lines into the feature vectors, but doesn't chunk them. This
     means that we have one observation per line. Since this transformation is the
     slowest part of the process it can be useful to do this once before using methods
-    that sample or analyze multiple times.
+    that sample or analyze multiple times. With cached=True the per line values are
+    also kept in the on disk feature cache (see cache.line_features), so the next
+    session doesn't have to redo it.
 
     Rather than calculating lots of these with different feature sets, it is probably
     better to calculate it with ALL_FEATURES and then subset the DataFrame using []
 
     Args:
         ll (list of bs4 <line>s): Lines to operate on
+        feats (list of str): Features to compute (see FEATURES)
+        cached (bool): Use (and fill) the on disk feature cache. This writes
+            files to cache.default_cache_dir() ($MQDQ_CACHE_DIR, or
+            ~/.cache/mqdq).
 
     Returns:
         (pandas.DataFrame): The results, one per row, with a header row
                             matching the predefined features
     """
 
-    return chunked_features(ll, n=1, feats=feats)
+    return chunked_features(ll, n=1, feats=feats, cached=cached)
 
 
-def centroid(ll, feats=ALL_FEATURES):
+def centroid(ll, feats=ALL_FEATURES, cached=False):
     """Returns the centroid (vector average) for the given set of lines
 
     Args:
         ll (list of bs4 <line>s): Lines to operate on
+        feats (list of str): Features to compute (see FEATURES)
+        cached (bool): Use (and fill) the on disk feature cache. This writes
+            files to cache.default_cache_dir() ($MQDQ_CACHE_DIR, or
+            ~/.cache/mqdq).
 
     Returns:
         (pandas.DataFrame): A DF containing one row, the centroid
     """
 
-    return chunked_features(ll, len(ll), feats)
+    return chunked_features(ll, len(ll), feats, cached)
+
+
+def _line_ref(l):
+
+    # book:line, the same label utils.chunk_lines gives a chunk
+    try:
+        p = l.parent
+        book = str(p["title"]) if getattr(p, "name", "") == "division" else ""
+        return book + ":" + str(l["name"])
+    except (KeyError, TypeError):
+        return "<??>"
+
+
+def rolling_features(ll, window, step=1, feats=ALL_FEATURES):
+    """Feature means over a sliding window of lines, eg every run of 100
+    consecutive lines. The windows can overlap (unlike chunked_features), but
+    the cost doesn't depend on the window size: the means all come from one
+    cumulative sum over the per line features.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        window (int): Window size (1 .. len(ll))
+        step (int): Distance between the starts of successive windows
+        feats (list of str): Features to compute (see FEATURES)
+
+    Returns:
+        (pandas.DataFrame): The results, one row per full window, indexed by
+                            the book:line reference of the window's first
+                            line (as from utils.chunk_lines).
+    """
+
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    if not isinstance(window, (int, np.integer)) or not 1 <= window <= len(ll):
+        raise ValueError("Window size must be between 1 and the number of lines")
+    if not isinstance(step, (int, np.integer)) or step < 1:
+        raise ValueError("Step must be at least 1")
+
+    m = feature_matrix(ll, feats)
+    cs = np.zeros((len(ll) + 1, m.shape[1]), dtype=np.result_type(m, np.int64))
+    np.cumsum(m, axis=0, dtype=cs.dtype, out=cs[1:])
+    starts = np.arange(0, len(ll) - window + 1, step)
+    means = (cs[starts + window] - cs[starts]) / window
+    index = pd.Index([_line_ref(ll[i]) for i in starts.tolist()], name="start")
+    return pd.DataFrame(means, index=index, columns=list(feats))
+
+
+class PackedFeatures:
+    """Per line features packed into one uint32 per line (about 4 bytes a
+    line, instead of 8 for every feature). Each binary feature gets one bit,
+    and each counting feature (like ELC) gets an 8 bit field. Sums over a set
+    of lines come from counting how many of the lines have each bit set, so
+    chunk and sample means never unpack the features line by line.
+
+    Build one with from_frame (eg from the output of distribution) or
+    from_lines. to_frame converts back, losslessly.
+
+    Args:
+        masks (numpy.ndarray): uint32, one per line
+        fields (list of (str, int, int)): name, shift and width of each
+            feature, in column order
+        index (pandas.Index, optional): Row labels, for to_frame
+    """
+
+    COUNT_BITS = 8
+
+    def __init__(self, masks, fields, index=None):
+        self.masks = np.asarray(masks, dtype=np.uint32)
+        self.fields = list(fields)
+        self.index = pd.RangeIndex(len(self.masks)) if index is None else index
+
+    @property
+    def feats(self):
+        return [f[0] for f in self.fields]
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __repr__(self):
+        return "<PackedFeatures (%d lines, %d features)>" % (
+            len(self),
+            len(self.fields),
+        )
+
+    @classmethod
+    def from_frame(cls, df):
+        """Pack a DataFrame with one row per line, like the output of
+        distribution. Raises ValueError if the values won't fit (anything
+        that isn't a small non-negative integer), or if there are too many
+        features.
+
+        Args:
+            df (pandas.DataFrame): The per line features
+
+        Returns:
+            (PackedFeatures): The result
+        """
+
+        values = df.to_numpy(dtype=np.float64)
+        if not np.array_equal(values, np.floor(values)) or (values < 0).any():
+            raise ValueError("Can only pack non-negative integer features")
+        maxes = values.max(axis=0) if len(values) else np.zeros(values.shape[1])
+        fields, shift = [], 0
+        for name, mx in zip(df.columns, maxes):
+            width = 1 if mx <= 1 else cls.COUNT_BITS
+            if mx >= 1 << width:
+                raise ValueError("Values of %s are too big to pack" % name)
+            fields.append((name, shift, width))
+            shift += width
+        if shift > 32:
+            raise ValueError("Too many features to pack into 32 bits")
+
+        masks = np.zeros(len(values), dtype=np.uint32)
+        for j, (_, shift, _) in enumerate(fields):
+            masks |= values[:, j].astype(np.uint32) << np.uint32(shift)
+        return cls(masks, fields, df.index)
+
+    @classmethod
+    def from_lines(cls, ll, feats=ALL_FEATURES):
+        """Compute and pack the features for some lines.
+
+        Args:
+            ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+            feats (list of str): Features to compute (see FEATURES)
+
+        Returns:
+            (PackedFeatures): The result
+        """
+
+        m = feature_matrix(ll, feats)
+        return cls.from_frame(pd.DataFrame(m, columns=list(feats)))
+
+    def to_frame(self):
+        """Unpack, into the same layout as distribution (float columns).
+
+        Returns:
+            (pandas.DataFrame): The per line features
+        """
+
+        cols = {
+            name: ((self.masks >> np.uint32(shift)) & np.uint32((1 << width) - 1))
+            for name, shift, width in self.fields
+        }
+        return pd.DataFrame(cols, index=self.index).astype(np.float64)
+
+    def sums(self, idx, block=1 << 22):
+        """Sum each feature over groups of lines.
+
+        Args:
+            idx (numpy.ndarray): Line indices, shape (groups, lines per group)
+            block (int): Roughly how many lines to unpack at once (memory cap)
+
+        Returns:
+            (numpy.ndarray): int64, shape (groups, features)
+        """
+
+        idx = np.asarray(idx)
+        weights = np.zeros((32, len(self.fields)), dtype=np.int64)
+        for j, (_, shift, width) in enumerate(self.fields):
+            weights[shift : shift + width, j] = 1 << np.arange(width)
+
+        res = np.empty((len(idx), len(self.fields)), dtype=np.int64)
+        step = max(1, block // max(1, idx.shape[1]))
+        for start in range(0, len(idx), step):
+            g = self.masks[idx[start : start + step]]
+            # how many lines in each group have each of the 32 bits set
+            bits = np.unpackbits(
+                g.astype("<u4").view(np.uint8).reshape(g.shape + (4,)),
+                axis=-1,
+                bitorder="little",
+            )
+            counts = bits.reshape(g.shape + (32,)).sum(axis=1, dtype=np.int64)
+            res[start : start + step] = counts @ weights
+        return res
+
+    def chunk_means(self, n, round=True):
+        """As _chunk_mean over to_frame(), but straight from the masks.
+
+        Args:
+            n (int): Chunk size
+            round (bool): Drop the last chunk if it's short
+
+        Returns:
+            (pandas.DataFrame): One row per chunk
+        """
+
+        full = len(self) // n
+        res = []
+        if full:
+            res.append(self.sums(np.arange(full * n).reshape(full, n)) / n)
+        if not round and len(self) % n:
+            rest = np.arange(full * n, len(self))[None, :]
+            res.append(self.sums(rest) / len(rest[0]))
+        values = np.vstack(res) if res else np.zeros((0, len(self.fields)))
+        return pd.DataFrame(values, columns=self.feats)
+
+    def sample_means(self, chunksz, n, seed=None):
+        """Means of n random samples of chunksz lines each (without
+        replacement). For a given seed this draws the same samples as
+        DataFrame.sample with a numpy RandomState, so the results match
+        mahalanobis._create_sampled_dist exactly.
+
+        Args:
+            chunksz (int): Lines per sample
+            n (int): Number of samples
+            seed (int, optional): Seed for the PRNG
+
+        Returns:
+            (pandas.DataFrame): One row per sample
+        """
+
+        if chunksz > len(self):
+            raise ValueError("Chunk size is bigger than source distribution.")
+        rng = np.random.RandomState(seed)
+        idx = np.empty((n, chunksz), dtype=np.intp)
+        for i in range(n):
+            idx[i] = rng.choice(len(self), size=chunksz, replace=False)
+        return pd.DataFrame(self.sums(idx) / chunksz, columns=self.feats)
 
 
 def harmony(l, n=4):
@@ -671,6 +1801,31 @@ def raw_phonemics(l):
     return ["".join(w.syls).lower().translate(DEFANCY) for w in rhyme.syllabify_line(l)]
 
 
+def word_syls(ll, idx=-1):
+    """Like word_idx_syls, but for every line at once, which is much faster on
+    big corpora (and fastest on a corpus.Corpus). The elision and prodelision
+    rules, and the errors, are the same.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        idx (int or "mid"): Word position (negative indices are OK), or "mid"
+            for the word ending at the third foot caesura (as
+            rhyme_classes.Line.midword)
+
+    Returns:
+        (numpy.ndarray): float, number of syllables, one per line (NaN for
+                         lines with no mid word)
+    """
+
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    b = FeatureBatch(ll)
+    res, bad = _word_syls(b, idx)
+    for i in np.flatnonzero(bad):
+        res[i] = _line_word_syls(b.ll[i], idx)
+    return res
+
+
 def word_idx_syls(l, idx):
     """For a given line, return the number of syllables in the word appearing
     at index `idx`. Attempts to cater for elision and prodelision (eg mea est
@@ -274,6 +274,16 @@ def _create_sampled_dist(dist, chunksz, distsz, seed=None):
     if chunksz > len(dist):
         raise ValueError("Chunk size is bigger than source distribution.")
 
+    try:
+        packed = la.PackedFeatures.from_frame(dist)
+    except ValueError:
+        pass  # not all small counts (or too many features), do it the slow way
+    else:
+        res = packed.sample_means(chunksz, distsz, seed)
+        # every row is one chunk, so it's labelled 0, as below
+        res.index = np.zeros(distsz, dtype=np.int64)
+        return res
+
     # This is much better than doing iterative pd.concat calls.
     d = np.empty(distsz, dtype=object)
     rng = np.random.RandomState(seed)
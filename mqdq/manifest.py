@@ -0,0 +1,236 @@
+"""
+Incremental, manifest driven loading for a directory of MQDQ XML files.
+
+The manifest records, for every XML file in a directory, its size, mtime and
+content hash, plus the derived artefacts (feature distributions,
+syllabifications and so on) that have been built from it. Refreshing only
+re-hashes files whose size or mtime changed, and only rebuilds artefacts for
+files whose content actually changed, so updating a few files in a directory
+of hundreds is cheap. The cleaned lines themselves come from cache.load_corpus.
+
+Artefacts are built by the functions in ARTEFACTS (or the artefacts argument),
+which take the Manifest and a filename. A builder can use other artefacts via
+Manifest.get, so eg the per-file centroid is derived from the cached
+distribution rather than recomputed from the lines.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import pandas as pd
+from typing import Any, Callable, Optional, Union
+import mqdq
+from mqdq import cache
+from mqdq import corpus
+from mqdq import line_analyzer as la
+from mqdq import rhyme
+
+PathLike = Union[str, pathlib.Path]
+Builder = Callable[["Manifest", str], Any]
+
+
+def _distribution(m: "Manifest", fn: str) -> pd.DataFrame:
+    return la.distribution(list(m.corpus(fn)))
+
+
+def _centroid(m: "Manifest", fn: str) -> pd.DataFrame:
+    # same as la.centroid, but from the cached per-line features
+    return m.get(fn, "distribution").mean().to_frame().T
+
+
+def _syllables(m: "Manifest", fn: str) -> list[list[list[str]]]:
+    # plain strings, one list of syllables per word, one list of words per line
+    return [
+        [[str(s) for s in w.syls] for w in l] for l in rhyme.syllabify(m.corpus(fn))
+    ]
+
+
+ARTEFACTS: dict[str, Builder] = {
+    "distribution": _distribution,
+    "centroid": _centroid,
+    "syllables": _syllables,
+}
+
+
+class Manifest:
+    """
+    A manifest for a directory of MQDQ XML files.
+
+    Args:
+        directory (str or Path): The directory holding the XML files
+        pattern (str, default="*.xml"): Glob for the files to include
+        cache_dir (str or Path, optional): Where to keep the manifest, the
+            cached corpora and the artefacts (default: cache.default_cache_dir())
+        artefacts (dict[str, Builder], optional): Artefact builders to use
+            instead of ARTEFACTS
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        pattern: str = "*.xml",
+        cache_dir: Optional[PathLike] = None,
+        artefacts: Optional[dict[str, Builder]] = None,
+    ):
+        self.directory = pathlib.Path(directory).resolve()
+        self.pattern = pattern
+        self.cache_dir = (
+            pathlib.Path(cache_dir) if cache_dir else cache.default_cache_dir()
+        )
+        self.artefacts = dict(ARTEFACTS if artefacts is None else artefacts)
+        # one manifest per directory, named for where it is
+        dir_key = hashlib.sha1(str(self.directory).encode()).hexdigest()[:16]
+        self.path = self.cache_dir / ("manifest-%s.json" % dir_key)
+        self.entries: dict[str, dict] = {}
+        self._corpora: dict[str, corpus.Corpus] = {}
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text())["files"]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self) -> str:
+        return "<Manifest %s (%d files)>" % (self.directory, len(self))
+
+    @property
+    def files(self) -> list[str]:
+        """The filenames (relative to the directory) in the manifest, sorted."""
+        return sorted(self.entries)
+
+    def _save(self):
+        data = json.dumps({"version": mqdq.__version__, "files": self.entries})
+        cache._atomic_write(self.path, lambda fh: fh.write(data.encode()))
+
+    def _artefact_path(self, fn: str, name: str) -> pathlib.Path:
+        stem, sha1 = pathlib.Path(fn).stem, self.entries[fn]["sha1"]
+        name = "%s-%s-%s-%s.pkl" % (stem, sha1, mqdq.__version__, name)
+        return self.cache_dir / "artefacts" / name
+
+    def _forget(self, fn: str):
+        # drop everything derived from the old contents of fn
+        for p in self.entries[fn].get("artefacts", {}).values():
+            try:
+                os.unlink(self.cache_dir / "artefacts" / p)
+            except FileNotFoundError:
+                pass
+        self._corpora.pop(fn, None)
+
+    def refresh(self, build: bool = True) -> dict[str, list[str]]:
+        """
+        Bring the manifest up to date with the directory. Files are only
+        re-hashed if their size or mtime changed, and artefacts are only
+        rebuilt for files whose content changed.
+
+        Args:
+            build (bool, default=True): Build all missing artefacts now. Otherwise
+                they are built on demand by get().
+
+        Returns:
+            dict[str, list[str]]: The files that were "added", "changed",
+            "removed" and "unchanged"
+        """
+        res: dict[str, list[str]] = {
+            "added": [],
+            "changed": [],
+            "removed": [],
+            "unchanged": [],
+        }
+        seen = set()
+        for p in sorted(self.directory.glob(self.pattern)):
+            fn = str(p.relative_to(self.directory))
+            seen.add(fn)
+            st = p.stat()
+            old = self.entries.get(fn)
+            if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+                res["unchanged"].append(fn)
+                continue
+            sha1 = cache.file_hash(p)
+            if old and old["sha1"] == sha1:
+                # touched, but the same contents
+                old["mtime"] = st.st_mtime
+                res["unchanged"].append(fn)
+                continue
+            if old:
+                self._forget(fn)
+                res["changed"].append(fn)
+            else:
+                res["added"].append(fn)
+            self.entries[fn] = {
+                "sha1": sha1,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "artefacts": {},
+            }
+
+        for fn in [fn for fn in self.entries if fn not in seen]:
+            self._forget(fn)
+            del self.entries[fn]
+            res["removed"].append(fn)
+
+        self._save()
+        if build:
+            for fn in self.files:
+                for name in self.artefacts:
+                    if not self._artefact_path(fn, name).exists():
+                        self.get(fn, name)
+        return res
+
+    def corpus(self, fn: str) -> corpus.Corpus:
+        """
+        The cleaned Corpus for a file in the manifest (via cache.load_corpus).
+
+        Args:
+            fn (str): Filename, relative to the directory
+
+        Returns:
+            corpus.Corpus: The result
+        """
+        if fn not in self._corpora:
+            self._corpora[fn] = cache.load_corpus(
+                self.directory / fn, cache_dir=self.cache_dir
+            )
+        return self._corpora[fn]
+
+    def get(self, fn: str, name: str) -> Any:
+        """
+        Fetch an artefact for a file in the manifest, building (and storing)
+        it if it is missing or out of date.
+
+        Args:
+            fn (str): Filename, relative to the directory
+            name (str): The artefact (a key of self.artefacts)
+
+        Returns:
+            Any: The artefact
+        """
+        if fn not in self.entries:
+            raise KeyError("%s is not in the manifest (try refresh())" % fn)
+        path = self._artefact_path(fn, name)
+        if path.exists():
+            try:
+                with open(path, "rb") as fh:
+                    return pickle.load(fh)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass  # damaged, rebuild it
+
+        obj = self.artefacts[name](self, fn)
+        cache._atomic_write(path, lambda fh: pickle.dump(obj, fh))
+        self.entries[fn]["artefacts"][name] = path.name
+        self._save()
+        return obj
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """
+        Concatenate a DataFrame artefact (eg "distribution" or "centroid") over
+        every file, with the filename as the outer level of the index. Only the
+        artefacts for changed files are rebuilt.
+
+        Args:
+            name (str): The artefact
+
+        Returns:
+            pd.DataFrame: The result
+        """
+        return pd.concat({fn: self.get(fn, name) for fn in self.files})
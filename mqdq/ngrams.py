@@ -1,4 +1,3 @@
-from bs4 import BeautifulSoup
 from collections import Counter
 import re
 import numpy as np
@@ -6,6 +5,7 @@ import pandas as pd
 from mqdq import utils
 from mqdq import rhyme
 from mqdq import line_analyzer as la
+from mqdq import cache
 import string
 import math
 
@@ -161,9 +161,9 @@ def geezit_corpus(
 
     for auth, title, fn in WORKS:
 
-        with open(fn) as fh:
-            soup = BeautifulSoup(fh, "xml")
-        ll = utils.clean(soup("line"))
+        # the Corpus is already cleaned, and stands in for the soup below
+        soup = cache.load_corpus(fn)
+        ll = list(soup)
 
         if title == "Punica" and drop_addit:
 
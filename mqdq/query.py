@@ -0,0 +1,306 @@
+"""
+Selecting lines by their metrical features, with boolean column queries.
+
+A LineTable holds one column per line feature (by default the binary
+features, ELC, and the caesura and harmony strings, see
+line_analyzer.FEATURES), plus the metre, pattern, work and book of every
+line, for one or more texts. Queries are small expressions over the columns,
+eg
+
+    pattern == "DSSS" & 3SC & !4DI & metre == "H"
+
+A bare feature name is true where the feature is non-zero, string columns
+compare with ==, != and =~ (a regex, matched against the whole value), and
+numeric columns with ==, !=, <, <=, > and >=. Combine with & (and), | (or),
+! or ~ (not) and parentheses. Every comparison is evaluated for all of the
+lines at once (string columns are compared once per distinct value), so
+queries over all of the bundled works take milliseconds. Results are line
+indices, or search.Ref references.
+"""
+
+import pathlib
+import re
+from typing import Any, Iterable, Optional
+import numpy as np
+from mqdq import cache
+from mqdq import corpus
+from mqdq import line_analyzer as la
+from mqdq.search import Ref
+from mqdq import store
+
+# the columns every LineTable has, as well as its features
+LINE_COLUMNS = ("metre", "pattern", "work", "book")
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<str>"[^"]*"|'[^']*')
+        |(?P<num>-?\d+(?:\.\d+)?(?![\w.]))
+        |(?P<op>==|!=|=~|<=|>=|[<>&|!~()])
+        |(?P<name>\w+)
+    )""",
+    re.VERBOSE,
+)
+
+_COMPARE = {
+    "==": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+
+def _tokenize(query: str) -> list[tuple[str, str]]:
+    res, pos, query = [], 0, query.rstrip()
+    while pos < len(query):
+        m = _TOKEN.match(query, pos)
+        if not m or m.end() == pos:
+            raise ValueError("Bad query at %r" % query[pos:])
+        res.append((m.lastgroup, m.group(m.lastgroup)))
+        pos = m.end()
+    return res
+
+
+class LineTable:
+    """
+    Feature columns over the lines of one or more texts.
+
+    Args:
+        feats (iterable of str, default=ALL_FEATURES plus CAES and HARM):
+            The line features to have columns for
+    """
+
+    def __init__(self, feats: Optional[Iterable[str]] = None):
+        if feats is None:
+            feats = la.ALL_FEATURES + ["CAES", "HARM"]
+        self.feats = list(feats)
+        la.check_features(self.feats)
+        self.refs: list[Ref] = []
+        self.lines: list[Any] = []
+        # column -> one array per text added, joined on first use
+        self._parts: dict[str, list[np.ndarray]] = {
+            k: [] for k in list(LINE_COLUMNS) + self.feats
+        }
+        self._columns: Optional[dict[str, Any]] = None
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __repr__(self) -> str:
+        works = len(set(r.work for r in self.refs))
+        return "<LineTable (%d works, %d lines, %d columns)>" % (
+            works,
+            len(self),
+            len(self._parts),
+        )
+
+    @classmethod
+    def from_files(
+        cls,
+        fns: Iterable[str],
+        feats: Optional[Iterable[str]] = None,
+        cached: bool = False,
+    ) -> "LineTable":
+        """
+        Build a table for some XML files, loaded through cache.load_corpus.
+        Works are named by the file stem (eg VERG-aene).
+
+        Args:
+            fns (iterable of str): The files
+            feats (iterable of str, optional): As for LineTable
+            cached (bool, default=False): As for add
+
+        Returns:
+            LineTable: The table
+        """
+        t = cls(feats)
+        for fn in fns:
+            t.add(cache.load_corpus(fn), pathlib.Path(fn).stem, cached)
+        return t
+
+    def add(self, soup, work: str = "", cached: bool = False):
+        """
+        Add every line of a text. The lines must be clean (as from
+        utils.clean, or a cleaned Corpus), as for line_analyzer.distribution.
+
+        Args:
+            soup (BeautifulSoup, reader.Document or corpus.Corpus): The text
+            work (str, optional): The work name, for the references and the
+                work column
+            cached (bool, default=False): Use (and fill) the on-disk feature
+                cache, which writes files to cache.default_cache_dir()
+        """
+        i = len(self.lines)
+        features = cache.line_feature_columns if cached else la.feature_columns
+        if isinstance(soup, corpus.Corpus):
+            lines = list(soup)
+            titles, div_of = soup.div_title.tolist(), soup.line_divisions().tolist()
+            books = [titles[d] for d in div_of]
+            names = soup.line_name.tolist()
+            metre, pattern = soup.metres().tolist(), soup.patterns().tolist()
+            cols = features(soup, self.feats)
+        else:
+            lines = list(soup("line"))
+            books = []
+            for l in lines:
+                p = getattr(l, "parent", None)
+                is_div = getattr(p, "name", "") == "division"
+                books.append(p.get("title", "") if is_div else "")
+            names = [l.get("name", "") for l in lines]
+            metre = [l.get("metre", "") for l in lines]
+            pattern = [l.get("pattern", "") for l in lines]
+            cols = features(lines, self.feats)
+
+        for k, name in enumerate(names):
+            self.refs.append(Ref(work, books[k], name, i + k))
+        self.lines += lines
+        cols.update(metre=metre, pattern=pattern, work=[work] * len(lines), book=books)
+        for name, col in cols.items():
+            self._parts[name].append(np.asarray(col))
+        self._columns = None
+
+    @property
+    def columns(self) -> dict[str, Any]:
+        """column -> numeric array, or (codes, values) for string columns."""
+        if self._columns is None:
+            self._columns = {}
+            for name, parts in self._parts.items():
+                col = np.concatenate(parts) if parts else np.zeros(0)
+                if col.dtype.kind in "OUS":
+                    values, codes = np.unique(col.astype(str), return_inverse=True)
+                    self._columns[name] = (codes.ravel(), values.tolist())
+                else:
+                    self._columns[name] = col
+        return self._columns
+
+    def _compare(self, name: str, op: Optional[str], value: Any) -> np.ndarray:
+        if name not in self.columns:
+            raise KeyError("Unknown column %s" % name)
+        col = self.columns[name]
+        if isinstance(col, tuple):
+            codes, values = col
+            if op == "=~":
+                r = re.compile(str(value))
+                hit = [bool(r.fullmatch(v)) for v in values]
+            elif op in ("==", "!="):
+                hit = [(v == str(value)) == (op == "==") for v in values]
+            else:
+                raise ValueError("Can't compare %s with %s" % (name, op or "nothing"))
+            return np.array(hit, dtype=bool)[codes]
+        if op is None:
+            return col != 0
+        if op not in _COMPARE or isinstance(value, str):
+            raise ValueError("Can't compare %s with %s %r" % (name, op, value))
+        return _COMPARE[op](col, value)
+
+    def mask(self, query: str) -> np.ndarray:
+        """
+        Evaluate a query (see the module docs).
+
+        Args:
+            query (str): The query
+
+        Returns:
+            numpy.ndarray: bool, one per line
+        """
+        tokens = _tokenize(query)
+        pos = 0
+
+        def peek() -> tuple[str, str]:
+            return tokens[pos] if pos < len(tokens) else ("end", "")
+
+        def take(kind: str, *values: str) -> str:
+            nonlocal pos
+            k, v = peek()
+            if k != kind or (values and v not in values):
+                raise ValueError("Bad query at %r: %s" % (v or "end", query))
+            pos += 1
+            return v
+
+        def disjunction() -> np.ndarray:
+            res = conjunction()
+            while peek() == ("op", "|"):
+                take("op")
+                res = res | conjunction()
+            return res
+
+        def conjunction() -> np.ndarray:
+            res = negation()
+            while peek() == ("op", "&"):
+                take("op")
+                res = res & negation()
+            return res
+
+        def negation() -> np.ndarray:
+            if peek() in (("op", "!"), ("op", "~")):
+                take("op")
+                return ~negation()
+            if peek() == ("op", "("):
+                take("op")
+                res = disjunction()
+                take("op", ")")
+                return res
+            k, name = peek()
+            name = take("num" if k == "num" else "name")
+            k, op = peek()
+            if k != "op" or op not in list(_COMPARE) + ["=~"]:
+                return self._compare(name, None, None)
+            take("op")
+            k, v = peek()
+            if k == "str":
+                value: Any = take("str")[1:-1]
+            else:
+                v = take("num")
+                value = float(v) if "." in v else int(v)
+            return self._compare(name, op, value)
+
+        res = disjunction()
+        if pos != len(tokens):
+            raise ValueError("Bad query at %r: %s" % (tokens[pos][1], query))
+        return res
+
+    def lines_for(self, query: str) -> np.ndarray:
+        """
+        Run a query, returning the indices of the matching lines.
+
+        Args:
+            query (str): The query
+
+        Returns:
+            numpy.ndarray: Matching line indices, in order
+        """
+        return np.flatnonzero(self.mask(query))
+
+    def count(self, query: str) -> int:
+        """The number of lines matching a query."""
+        return int(self.mask(query).sum())
+
+    def search(self, query: str) -> list[Ref]:
+        """
+        Run a query, returning line references.
+
+        Args:
+            query (str): The query
+
+        Returns:
+            list[Ref]: References to the matching lines
+        """
+        return [self.refs[i] for i in self.lines_for(query)]
+
+    def line(self, ref: Ref) -> Any:
+        """The line for a reference."""
+        return self.lines[ref.index]
+
+
+def bundled_table(feats: Optional[Iterable[str]] = None) -> LineTable:
+    """
+    Build a table over all of the works that ship with the package.
+
+    Args:
+        feats (iterable of str, optional): As for LineTable
+
+    Returns:
+        LineTable: The table
+    """
+    return LineTable.from_files([str(fn) for fn in store.bundled_works()], feats)
@@ -0,0 +1,454 @@
+"""
+Streaming reader for the MQDQ / Pedecerto XML format.
+
+BeautifulSoup builds a full Tag tree for every file, which is slow (the
+Aeneid takes seconds) and heavy (every Tag stays alive for as long as we hold
+on to the lines). This module uses lxml's iterparse to walk the file once,
+building small slotted records and clearing the XML elements as it goes.
+
+The records implement the (small) subset of the bs4.element.Tag API that the
+rest of this package uses - l("word"), l["metre"], w["sy"], w.has_attr("mf"),
+w.text, .parent and so on - so they can be passed to line_analyzer, rhyme,
+babble etc without changes.
+"""
+
+import io
+import re
+from lxml import etree
+from typing import Iterator, Optional, Union, IO
+from xml.sax.saxutils import escape, quoteattr, unescape
+
+# The only word attributes MQDQ uses. Anything else is dropped when reading.
+WORD_ATTRS = ("sy", "wb", "mf")
+
+
+class _TagLike:
+    # Shared plumbing for the bs4 lookalike API. Subclasses provide _attr.
+    __slots__ = ()
+    name = ""
+
+    def _attr(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def __getitem__(self, key: str) -> str:
+        v = self._attr(key)
+        if v is None:
+            raise KeyError(key)
+        return v
+
+    def get(self, key: str, default=None):
+        v = self._attr(key)
+        return default if v is None else v
+
+    def has_attr(self, key: str) -> bool:
+        return self._attr(key) is not None
+
+    def find_all(self, name: str) -> list:
+        return []
+
+    def __call__(self, name: str) -> list:
+        # bs4 shortcut: l("word") is l.find_all("word")
+        return self.find_all(name)
+
+    def _render_attrs(self) -> str:
+        # bs4 renders attributes in alphabetical order, which is what
+        # the doctests (and our eyes) are used to.
+        return "".join(
+            " %s=%s" % (k, quoteattr(v)) for k, v in sorted(self.attrs.items())
+        )
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        raise NotImplementedError
+
+
+class WordRecord(_TagLike):
+    """A single MQDQ <word>. Missing attributes are stored as None, and
+    behave like a missing attribute on a bs4 Tag (KeyError on lookup)."""
+
+    __slots__ = ("text", "sy", "wb", "mf", "parent")
+    name = "word"
+
+    def __init__(
+        self,
+        text: str,
+        sy: Optional[str] = None,
+        wb: Optional[str] = None,
+        mf: Optional[str] = None,
+        parent: Optional["LineRecord"] = None,
+    ):
+        self.text = text
+        self.sy = sy
+        self.wb = wb
+        self.mf = mf
+        self.parent = parent
+
+    @classmethod
+    def from_tag(cls, w) -> "WordRecord":
+        """Build a record from anything Tag-like (a bs4 Tag or another record)."""
+        return cls(w.text, w.get("sy"), w.get("wb"), w.get("mf"))
+
+    def _attr(self, key: str) -> Optional[str]:
+        if key in WORD_ATTRS:
+            return getattr(self, key)
+        return None
+
+    def __setitem__(self, key: str, value: str):
+        if key not in WORD_ATTRS:
+            raise KeyError("Unsupported word attribute: %s" % key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        if key in WORD_ATTRS:
+            setattr(self, key, None)
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return {k: v for k in WORD_ATTRS if (v := getattr(self, k)) is not None}
+
+    # Like copying a bs4 Tag, the copy is detached from the tree.
+    def __copy__(self) -> "WordRecord":
+        return WordRecord(self.text, self.sy, self.wb, self.mf)
+
+    # pickle support for slotted classes with no __dict__
+    def __getstate__(self):
+        return (self.text, self.sy, self.wb, self.mf, self.parent)
+
+    def __setstate__(self, state):
+        self.text, self.sy, self.wb, self.mf, self.parent = state
+
+    def __repr__(self) -> str:
+        return "<word%s>%s</word>" % (self._render_attrs(), escape(self.text))
+
+    __str__ = __repr__
+
+
+class LineRecord(_TagLike):
+    """A single MQDQ <line>, holding its attributes (name, metre, pattern...)
+    and a list of WordRecords."""
+
+    __slots__ = ("_attrs", "words", "parent", "__weakref__")
+    name = "line"
+
+    def __init__(
+        self,
+        attrs: dict[str, str],
+        words: Optional[list[WordRecord]] = None,
+        parent: Optional["Division"] = None,
+    ):
+        self._attrs = attrs
+        self.words = words if words is not None else []
+        self.parent = parent
+        for w in self.words:
+            w.parent = self
+
+    @classmethod
+    def build(cls, attrs: dict[str, str], words: list) -> "LineRecord":
+        """Build a new (detached) line from copies of some Tag-like words.
+        The words can be bs4 Tags or WordRecords, and the originals are not
+        modified."""
+        return cls(dict(attrs), [WordRecord.from_tag(w) for w in words])
+
+    def _attr(self, key: str) -> Optional[str]:
+        return self._attrs.get(key)
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return self._attrs
+
+    def __setitem__(self, key: str, value: str):
+        self._attrs[key] = value
+
+    def __delitem__(self, key: str):
+        del self._attrs[key]
+
+    def find_all(self, name: str) -> list:
+        if name == "word":
+            return list(self.words)
+        return []
+
+    @property
+    def text(self) -> str:
+        return " ".join(w.text for w in self.words)
+
+    def __contains__(self, w) -> bool:
+        return any(w is x for x in self.words)
+
+    def __copy__(self) -> "LineRecord":
+        return LineRecord.build(self._attrs, self.words)
+
+    def __getstate__(self):
+        return (self._attrs, self.words, self.parent)
+
+    def __setstate__(self, state):
+        self._attrs, self.words, self.parent = state
+
+    def __repr__(self) -> str:
+        inner = "".join("%r\n" % w for w in self.words)
+        return "<line%s>\n%s</line>" % (self._render_attrs(), inner)
+
+    __str__ = __repr__
+
+
+class Division(_TagLike):
+    """An MQDQ <division> (usually a book)."""
+
+    __slots__ = ("_attrs", "lines", "parent")
+    name = "division"
+
+    def __init__(self, attrs: dict[str, str], parent: Optional["Document"] = None):
+        self._attrs = attrs
+        self.lines: list[LineRecord] = []
+        self.parent = parent
+
+    def _attr(self, key: str) -> Optional[str]:
+        return self._attrs.get(key)
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return self._attrs
+
+    def find_all(self, name: str) -> list:
+        if name == "line":
+            return list(self.lines)
+        if name == "word":
+            return [w for l in self.lines for w in l.words]
+        return []
+
+    def __contains__(self, l) -> bool:
+        # lines know which division they belong to, so this is O(1), unlike
+        # the linear scan through the children that bs4 does.
+        return getattr(l, "parent", None) is self
+
+    def __getstate__(self):
+        return (self._attrs, self.lines, self.parent)
+
+    def __setstate__(self, state):
+        self._attrs, self.lines, self.parent = state
+
+    def __repr__(self) -> str:
+        return "<division%s> (%d lines)" % (self._render_attrs(), len(self.lines))
+
+
+class Document(_TagLike):
+    """The whole file. Stands in for the BeautifulSoup object, so
+    doc("line") and doc("division") work as they do on a soup."""
+
+    __slots__ = ("author", "title", "divisions", "_loose", "__weakref__")
+    name = "[document]"
+
+    def __init__(self, author: str = "", title: str = ""):
+        self.author = author
+        self.title = title
+        self.divisions: list[Division] = []
+        # lines that aren't inside any division (rare)
+        self._loose: list[LineRecord] = []
+
+    def _attr(self, key: str) -> Optional[str]:
+        return None
+
+    @property
+    def attrs(self) -> dict[str, str]:
+        return {}
+
+    def find_all(self, name: str) -> list:
+        if name == "division":
+            return list(self.divisions)
+        if name == "line":
+            return self._loose + [l for d in self.divisions for l in d.lines]
+        if name == "word":
+            return [w for l in self.find_all("line") for w in l.words]
+        return []
+
+    def __getstate__(self):
+        return (self.author, self.title, self.divisions, self._loose)
+
+    def __setstate__(self, state):
+        self.author, self.title, self.divisions, self._loose = state
+
+    def __repr__(self) -> str:
+        return "<document %s - %s (%d divisions)>" % (
+            self.author,
+            self.title,
+            len(self.divisions),
+        )
+
+
+Source = Union[str, IO[bytes]]
+
+
+def _release(elem):
+    # Standard lxml iterparse trick: clear the element, and drop any already
+    # processed siblings so the partial tree doesn't grow as we read.
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _events(
+    src: Source, doc: Optional[Document] = None
+) -> Iterator[Union[LineRecord, Division]]:
+    # Yields each LineRecord as soon as it is complete, and each Division
+    # when it closes. Lines are attached to the current division as we go, so
+    # memory is bounded by one division if the caller doesn't keep them.
+    div = None
+    for event, elem in etree.iterparse(
+        src,
+        events=("start", "end"),
+        tag=("division", "line", "author", "title"),
+    ):
+        tag = elem.tag
+        if event == "start":
+            if tag == "division":
+                div = Division(dict(elem.attrib), doc)
+            continue
+
+        if tag == "line":
+            words = [
+                WordRecord(
+                    w.text or "",
+                    w.get("sy"),
+                    w.get("wb"),
+                    w.get("mf"),
+                )
+                for w in elem.iterchildren("word")
+            ]
+            l = LineRecord(dict(elem.attrib), words, div)
+            if div is not None:
+                div.lines.append(l)
+            elif doc is not None:
+                doc._loose.append(l)
+            _release(elem)
+            yield l
+        elif tag == "division":
+            if div is not None:
+                yield div
+            div = None
+            _release(elem)
+        elif doc is not None and elem.getparent() is not None:
+            # <author> and <title> in the <head>
+            if elem.getparent().tag == "head":
+                setattr(doc, tag, (elem.text or "").strip())
+
+
+def iterlines(src: Source) -> Iterator[LineRecord]:
+    """
+    Stream the lines of an MQDQ XML file, one LineRecord at a time.
+
+    Args:
+        src (str or binary file object): File to read
+
+    Returns:
+        Iterator[LineRecord]: The lines, in document order
+    """
+    for x in _events(src):
+        if isinstance(x, LineRecord):
+            yield x
+
+
+def iterdivisions(src: Source) -> Iterator[Division]:
+    """
+    Stream the divisions (books) of an MQDQ XML file. Each Division is yielded
+    once it is complete, so d("line") holds all of its lines.
+
+    Args:
+        src (str or binary file object): File to read
+
+    Returns:
+        Iterator[Division]: The divisions, in document order
+    """
+    for x in _events(src):
+        if isinstance(x, Division):
+            yield x
+
+
+def read(src: Source) -> Document:
+    """
+    Read a whole MQDQ XML file into a Document, which can be used anywhere
+    that a BeautifulSoup of the file was used before (eg doc("line"),
+    doc("division"), utils.bookref(l, doc)).
+
+    Args:
+        src (str or binary file object): File to read
+
+    Returns:
+        Document: The result
+    """
+    doc = Document()
+    for x in _events(src, doc):
+        if isinstance(x, Division):
+            doc.divisions.append(x)
+    return doc
+
+
+_DIV_START = re.compile(rb"<division\b[^>]*>")
+_TITLE_ATTR = re.compile(rb"""\btitle\s*=\s*(["'])(.*?)\1""", re.S)
+_HEAD_FIELD = re.compile(rb"<(author|title)>(.*?)</\1>", re.S)
+
+
+def _attr_text(b: bytes) -> str:
+    return unescape(b.decode(), {"&quot;": '"', "&apos;": "'"}).strip()
+
+
+class DivisionIndex:
+    """
+    The byte offsets of each <division> in an MQDQ XML file, found with a quick
+    textual scan (no XML parsing). Indexing parses just that division, so
+    pulling one book of a twelve book work costs about a twelfth of reading
+    the whole file. Nothing is cached here.
+
+    Args:
+        fn (str): The XML file (must be a path, since we seek in it)
+    """
+
+    def __init__(self, fn: str):
+        self.fn = fn
+        with open(fn, "rb") as fh:
+            data = fh.read()
+
+        # keep the XML declaration, so each chunk is decoded the same way as
+        # the whole file would be
+        self._decl = b""
+        if data.startswith(b"<?xml"):
+            self._decl = data[: data.index(b"?>") + 2]
+
+        self.offsets: list[tuple[int, int]] = []
+        self.titles: list[str] = []
+        for m in _DIV_START.finditer(data):
+            start = m.start()
+            if m.group().endswith(b"/>"):
+                end = m.end()
+            else:
+                end = data.index(b"</division>", m.end()) + len(b"</division>")
+            # a nested or overlapping match would mean the file isn't flat
+            if self.offsets and start < self.offsets[-1][1]:
+                raise ValueError("Nested <division> in %s" % fn)
+            self.offsets.append((start, end))
+            t = _TITLE_ATTR.search(m.group())
+            self.titles.append(_attr_text(t.group(2)) if t else "")
+
+        head = data[: self.offsets[0][0]] if self.offsets else data
+        fields = {k.decode(): _attr_text(v) for k, v in _HEAD_FIELD.findall(head)}
+        self.doc = Document(fields.get("author", ""), fields.get("title", ""))
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Division:
+        start, end = self.offsets[i]
+        with open(self.fn, "rb") as fh:
+            fh.seek(start)
+            chunk = fh.read(end - start)
+        div = None
+        for x in _events(io.BytesIO(self._decl + chunk)):
+            if isinstance(x, Division):
+                div = x
+        if div is None:
+            raise ValueError("No division at offset %d in %s" % (start, self.fn))
+        div.parent = self.doc
+        return div
+
+    def __repr__(self) -> str:
+        return "<DivisionIndex %s (%d divisions)>" % (self.fn, len(self))
@@ -2,12 +2,17 @@ GLOBAL_RHYME_THRESH = 1.75
 
 from mqdq.cltk_hax.syllabifier import Syllabifier
 import re
+import contextlib
+import copy
+import io
+from concurrent.futures import ProcessPoolExecutor
+from mqdq import reader
 from mqdq import utils
 from mqdq import line_analyzer as la
 import string
-from collections import namedtuple, UserString
+from collections import namedtuple, OrderedDict, UserString
 from dataclasses import dataclass
-from typing import List, Any, Tuple
+from typing import List, Any, Optional, Tuple
 import bs4
 from bs4 import BeautifulSoup
 from itertools import combinations
@@ -366,11 +371,86 @@ def _punct_split(w):
         return ["", ary[0], ""]
 
 
+# Word level caches. The same word form, with the same scansion, turns up
+# hundreds of times in an epic, so the (pre elision) syllabification of each
+# word, and the phonetification of each (post elision) set of syllables, are
+# kept here, keyed by everything they depend on: the text, mf and the sy with
+# the foot numbers masked out (neither cares which foot a word is in, only
+# about the syllable count and quantities). Entries are tuples, and every
+# Word gets its own fresh list, so the line level elision (which edits the
+# syls of neighbouring words) never touches a cached entry. Failures aren't
+# cached, so they fail (and print) the same way every time.
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class _WordCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        hit = self.data.get(key)
+        if hit is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.data.move_to_end(key)
+        return hit
+
+    def put(self, key, value):
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data))
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = 0
+
+
+_FOOTLESS = str.maketrans("123456789", "#########")
+_SYLLABIFIED = _WordCache(1 << 16)
+_PHONETIFIED = _WordCache(1 << 16)
+
+
+def word_cache_info():
+    """Hit rates for the word level syllabification and phonetification
+    caches, and for the underlying Syllabifier.
+
+    Returns:
+        (dict): "syllabify", "phonetify" and "syllabifier" -> CacheInfo
+    """
+
+    return {
+        "syllabify": _SYLLABIFIED.info(),
+        "phonetify": _PHONETIFIED.info(),
+        "syllabifier": S.cache_info(),
+    }
+
+
+def word_cache_clear():
+    """Empty the word level caches (and reset their stats)."""
+    _SYLLABIFIED.clear()
+    _PHONETIFIED.clear()
+    S.cache_clear()
+
+
 def _syllabify_word(w):
 
     # Word is a dataclass, the constructor is prepunct, syl_array, postpunct, mqdq
-    pre, txt, post = _punct_split(w)
-    return Word(pre, _syllabify_text(w, txt), post, w)
+    sy = w.get("sy")
+    key = (w.text, sy and sy.translate(_FOOTLESS), w.get("mf"))
+    hit = _SYLLABIFIED.get(key)
+    if hit is None:
+        pre, txt, post = _punct_split(w)
+        hit = (pre, tuple(_syllabify_text(w, txt)), post)
+        _SYLLABIFIED.put(key, hit)
+    pre, syls, post = hit
+    return Word(pre, list(syls), post, w)
 
 
 def _elide(s1, s2):
@@ -396,61 +476,78 @@ def _elide(s1, s2):
     return Syl(s1 + s2)
 
 
+# The phonetic rules, as tables. The letter substitutions don't chain (no
+# output is also an input) so they're one translate.
+PHONETIC = {**VW, **YU, **CK}
+_CONSONANTS = set("bcdfghjklmnpqrstvwxzBCDFGHJKLMNPQRSTVWXZ")
+_QU = (("qu", "kw"), ("Qu", "Kw"), ("QU", "KW"), ("q", "kw"), ("Q", "Kw"))
+_ASPIRATES = set("pkrtPKRT")
+_SYLS: dict[str, Syl] = {}
+# short syllables are a small set, this is every one seen so far, macronized
+_MACRONIZED: dict[str, str] = {}
+
+
 def _phonetify(w) -> Word:
 
-    scan_syls = re.findall("..", w.mqdq["sy"])
-    slen = len(w.syls)
-    if "_" in w.syls:
+    key = (w.text, w.sy.translate(_FOOTLESS), w.mf, tuple(w.syls))
+    hit = _PHONETIFIED.get(key)
+    if hit is None:
+        hit = tuple(_phonetify_syls(w))
+        _PHONETIFIED.put(key, hit)
+    w.syls = list(hit)
+    return w
+
+
+def _phonetify_syls(w) -> list[Syl]:
+
+    # works on (and replaces) w.syls, returns the new ones. This is one pass
+    # over the syllables, with each rule as a plain string check (see the
+    # tables above _phonetify). The rules for a syllable can change its
+    # neighbours (x moves a k back, gn and the aspirates move a letter
+    # forward), so a syllable is only macronized once the next one is done.
+    syls = w.syls
+    quant = w.sy[1::2]
+    slen = len(syls)
+    if "_" in syls:
         slen -= 1
-    for idx, s_syl in enumerate(scan_syls):
-        if idx + 1 > slen:
-            break
+    n = min(len(quant), slen)
+    for idx in range(n):
 
         # phoenetic representation, but not 'real' IPA
         try:
-            w.syls[idx] = w.syls[idx].translate(VW).translate(YU).translate(CK)
+            s = syls[idx].translate(PHONETIC)
         except Exception as e:
             print(w)
             raise e
 
         # x at the start of a non-initial syllable becomes the cluster 'ks'
         # and the k moves backwards I.xi.on -> Ik.si.on
-        if idx > 0 and w.syls[idx].startswith("x"):
-            w.syls[idx - 1] += "k"
-            w.syls[idx] = "s" + w.syls[idx][1:]
+        if idx > 0 and s.startswith("x"):
+            syls[idx - 1] += "k"
+            s = "s" + s[1:]
 
-        if w.syls[idx].endswith("x"):
-            w.syls[idx] = w.syls[idx][:-1] + "ks"
+        if s.endswith("x"):
+            s = s[:-1] + "ks"
 
         # remaining double consonants at the start of a syllable get compressed
         # geminate consonants in general should already have been split
-        dc = DBL_CONS.match(w.syls[idx])
-        if dc:
-            w.syls[idx] = dc.group(1) + w.syls[idx][2:]
-
-        # qu becomes 'kw', although really
-        # it should probably be more like rounded k (kʷ) per Allen
-        if re.search("qu", w.syls[idx], flags=re.I):
-            w.syls[idx] = re.sub("qu", "kw", w.syls[idx])
-            w.syls[idx] = re.sub("Qu", "Kw", w.syls[idx])
-            w.syls[idx] = re.sub("QU", "KW", w.syls[idx])
-
-        # Hack. Sometimes que gets elided so you have a bare q before a vowel.
-        # If the last regexp didn't match it's safe to try again.
-        if re.search("q", w.syls[idx], flags=re.I):
-            w.syls[idx] = re.sub("q", "kw", w.syls[idx])
-            w.syls[idx] = re.sub("Q", "Kw", w.syls[idx])
-            w.syls[idx] = re.sub("Q", "KW", w.syls[idx])
+        if len(s) > 1 and s[0] in _CONSONANTS and s[1].lower() == s[0].lower():
+            s = s[0] + s[2:]
+
+        # qu becomes 'kw', although really it should probably be more like
+        # rounded k (kʷ) per Allen. Sometimes que gets elided so you have a
+        # bare q before a vowel, which also becomes kw.
+        if "q" in s or "Q" in s:
+            for q, kw in _QU:
+                s = s.replace(q, kw)
+
+        nxt = syls[idx + 1] if len(syls) > idx + 1 else ""
 
         # gn was pronounced as a palatalised nasal, which I'm writing as nj
-        if (
-            len(w.syls) > idx + 1
-            and w.syls[idx].endswith("g")
-            and w.syls[idx + 1].startswith("n")
-        ):
+        if s.endswith("g") and nxt.startswith("n"):
             # mag.nus -> man.jus
-            w.syls[idx] = w.syls[idx][:-1] + "n"
-            w.syls[idx + 1] = "j" + w.syls[idx + 1][1:]
+            s = s[:-1] + "n"
+            syls[idx + 1] = "j" + nxt[1:]
 
         # the cluster 'ph' / 'kh' represent aspirated p (pʰ/kʰ) so these should not be split
         # across syllable boundaries. Can't change 'ph' to 'f' because it's
@@ -461,113 +558,143 @@ def _phonetify(w) -> Word:
         #
         # I'm also resolving 'rh' and 'rrh' which were introduced to transcribe A.Gk.ῤ and ῤῥ
         # which were 'voiceless r'. Allen (33) doubts if these were ever pronounced unvoiced.
-        if (
-            len(w.syls) > idx + 1
-            and w.syls[idx][-1] in "pkr"
-            and w.syls[idx + 1].startswith("h")
-        ):
+        elif len(syls) > idx + 1 and s[-1] in "pkr" and nxt.startswith("h"):
             # we don't include 't' here because posthabita is post.ha.bi.ta (aspiration on the 'a')
             # TODO: this means eg Teuthra is still not correct (Teut.hra, want Teut.ra) but it's
             # more correct this way than de-aspirating a ton of vowels
-            w.syls[idx + 1] = w.syls[idx][-1] + w.syls[idx + 1][1:]
-            w.syls[idx] = w.syls[idx][:-1]
+            syls[idx + 1] = s[-1] + nxt[1:]
+            s = s[:-1]
 
         # resolve aspirated consonants at the start and end of syllables
-        if re.match("[pkrt]h", w.syls[idx], flags=re.I):
-            w.syls[idx] = w.syls[idx][0] + w.syls[idx][2:]
-        if re.search("[pkrt]h$", w.syls[idx], flags=re.I):
-            w.syls[idx] = w.syls[idx][:-1]
+        if len(s) > 1 and s[0] in _ASPIRATES and s[1] in "hH":
+            s = s[0] + s[2:]
+        if len(s) > 1 and s[-2] in _ASPIRATES and s[-1] in "hH":
+            s = s[:-1]
 
         # this handling is still not perfect, but hopefully the remaining errors are
         # confined to irritating Greek names and loanwords.
 
-    for idx, s_syl in enumerate(scan_syls):
-        if idx + 1 > slen:
-            # safety valve
-            break
-        if len(w.syls[idx]) < 3 and s_syl[-1] in "AT":
-            w.syls[idx] = _macronize_short_syl(w.syls[idx])
+        syls[idx] = s
+        if idx > 0:
+            _macronize_at(syls, idx - 1, quant)
+    if n > 0:
+        _macronize_at(syls, n - 1, quant)
 
-    # My syllable string after parsing looks like 5A5b5c`6A6X etc
-    # which is converted to ['5A', '5b', '5c', '`', '6A', '6X']
-    sarr = re.findall("[1-9ATXbc]{1,2}|`|_", la._get_syls_with_stress(w.mqdq))
-    if "`" in sarr:
+    stress = la._stressed_syl(w.text, w.sy, w.mf or None)
+    if stress is not None:
         # strip leading ` if it's there, to stay idempotent
-        w.syls[sarr.index("`")] = "`" + w.syls[sarr.index("`")].lstrip("`")
+        stress = range(len(w.sy) // 2)[stress]
+        syls[stress] = "`" + syls[stress].lstrip("`")
 
-    if len(w.syls) > 0 and w.syls[-1][-1] in "mM":
+    if len(syls) > 0 and syls[-1][-1] in "mM":
         # elision has taken place by now, so final m does not
         # precede a vowel, so it should be dropped.
-        stored_m = w.syls[-1][-1]
-        w.syls[-1] = w.syls[-1][:-1]
+        stored_m = syls[-1][-1]
+        syls[-1] = syls[-1][:-1]
         # if what's left ends with a macron, it was a vowel
         # that now needs to be nasalised (tilde) instead
         # 4/22 allow tilde to be stacked onto macron
-        if w.syls[-1][-1] in VOWELS or w.syls[-1][-1] == COMBINING_MACRON:
-            w.syls[-1] += COMBINING_TILDE
+        if syls[-1][-1] in VOWELS or syls[-1][-1] == COMBINING_MACRON:
+            syls[-1] += COMBINING_TILDE
         # Change 16/11/20: reverse my previous practice of dropping final m
         # I still don't think they're pronounced, but they matter for working
         # out length by position, so we'll keep it :/
-        w.syls[-1] += stored_m
+        syls[-1] += stored_m
 
     # ensure that the syls are turned into the fancy subclass, in case they got
     # made into normal strings while messing around above.
-    w.syls = [Syl(s) for s in w.syls]
+    w.syls = [_syl(s) for s in syls]
+
+    return w.syls
+
+
+def _macronize_at(syls, idx, quant):
+    s = syls[idx]
+    if len(s) < 3 and quant[idx] in "AT":
+        m = _MACRONIZED.get(s)
+        if m is None:
+            m = _MACRONIZED[s] = _macronize_short_syl(s)
+        syls[idx] = m
 
-    return w
+
+def _syl(s) -> Syl:
+    # Syls are never changed once they're built, so the (few thousand)
+    # distinct ones are shared
+    syl = _SYLS.get(s)
+    if syl is None:
+        if len(_SYLS) >= 1 << 16:
+            _SYLS.clear()
+        syl = _SYLS[s] = Syl(s)
+    return syl
 
 
 def _elision_phon(line, metre):
 
+    # Copy on write. The Words in line are never changed (they're the word
+    # level syllabification, which can be shared), the elisions are worked
+    # out on copies of their syls, and the result is a new Line of new Words.
+    syls = [list(w.syls) for w in line]
+    post = [w.post_punct for w in line]
+
     # resolve elision first, at the line level
     for idx, w in enumerate(line):
-        if w.mqdq.has_attr("mf"):
+        if w.mf:
             # synalepha ie 'normal' elision here
-            if w.mqdq["mf"] == "SY":
+            if w.mf == "SY":
 
                 try:
-                    elided = _elide(w.syls[-1], line[idx + 1].syls[0])
+                    elided = _elide(syls[idx][-1], syls[idx + 1][0])
                 except IndexError as e:
                     print("IndexError while eliding - check the text.")
-                    print(line)
+                    print(_derive(line, syls, post))
                     raise e
 
-                w.syls[-1] = "_"
+                syls[idx][-1] = "_"
 
                 # If an elision puts a g next to an n, make the phonetic
                 # conversion here ignem exercentibus -> in_ jex
                 # the rest (x -> ks) will be fixed up in phonetify, but
                 # that method only sees one word at a time, so it can't do this.
                 if (
-                    len(w.syls) > 1
-                    and w.syls[-2].endswith("g")
+                    len(syls[idx]) > 1
+                    and syls[idx][-2].endswith("g")
                     and elided.startswith(("n", "N"))
                 ):
                     if elided.startswith("n"):
                         elided = "j" + elided[1:]
                     else:
                         elided = "J" + elided[1:]
-                    w.syls[-2] = w.syls[-2][:-1] + "n"
+                    syls[idx][-2] = syls[idx][-2][:-1] + "n"
 
-                line[idx + 1].syls[0] = elided
+                syls[idx + 1][0] = elided
                 # drop final punctuation, elision over punct is silly
-                w.post_punct = ""
+                post[idx] = ""
             # prodelision, which 'elides backwards' (puella est -> puellast)
-            elif w.mqdq["mf"] == "PE":
-                line[idx - 1].syls[-1] = (
-                    line[idx - 1].syls[-1].rstrip("mM") + "_" + w.syls[0].lstrip(VOWELS)
+            elif w.mf == "PE":
+                syls[idx - 1][-1] = (
+                    syls[idx - 1][-1].rstrip("mM") + "_" + syls[idx][0].lstrip(VOWELS)
                 )
                 # w.syls[0] = "_"
-                if len(w.syls) > 1:
-                    w.syls[0] = "_"
+                if len(syls[idx]) > 1:
+                    syls[idx][0] = "_"
                 else:
                     # this leaves the word and its post punctuation.
                     # removing the word entirely breaks alignment
                     # for things like blat.
-                    w.syls = []
+                    syls[idx] = []
 
     # now do phonetics at the word level
-    return Line([_phonetify(w) for w in line], metre)
+    return Line([_phonetify(w) for w in _derive(line, syls, post)], metre)
+
+
+def _derive(line, syls, post) -> list[Word]:
+    # copies of the Words in line, with new syls and post_punct
+    res = []
+    for w, s, p in zip(line, syls, post):
+        c = copy.copy(w)
+        c.syls, c.post_punct = s, p
+        res.append(c)
+    return res
 
 
 def syllabify_line(l) -> Line:
@@ -590,26 +717,70 @@ def syllabify_line(l) -> Line:
     return _elision_phon(line, l["metre"])
 
 
-def syllabify(ll) -> LineSet:
+def syllabify(ll, workers: Optional[int] = None) -> LineSet:
     """Syllabify a set of raw MQDQ line. Returns a rhyme_classes.LineSet.
 
     Args:
         ll (enumerable of bs4 <line>): Lines to syllabify
+        workers (int, optional): If > 1, split the lines into that many
+            contiguous shards and syllabify them in a process pool. The
+            result is the same, in the same order, and the Words still
+            point at the original <word>s.
 
     Returns:
         (rhyme_classes.LineSet): LineSet object.
     """
+    ll = list(ll)
+    n = min(workers or 1, len(ll))
+    if n <= 1:
+        return LineSet([_syllabify_at(i, l) for i, l in enumerate(ll)])
+
+    # detached copies of the lines go to the workers, not the (bs4) trees
+    bounds = [len(ll) * k // n for k in range(n + 1)]
+    starts = bounds[:-1]
+    shards = [
+        [reader.LineRecord.build(l.attrs, l("word")) for l in ll[a:b]]
+        for a, b in zip(bounds, bounds[1:])
+    ]
     lines = []
-    # do it this way so we can fail more informatively
-    for i, l in enumerate(ll):
-        try:
-            lines.append(syllabify_line(l))
-        except ValueError as e:
-            print(f"Failed to syllabify at index {i} on {l}")
-            raise e
+    with ProcessPoolExecutor(max_workers=n) as ex:
+        for done, failed in ex.map(_syllabify_shard, starts, shards):
+            lines += done
+            if failed is not None:
+                # carry on here from that line, so it fails (and prints) with
+                # the original line, exactly as it would have without workers
+                lines += [_syllabify_at(i, ll[i]) for i in range(failed, len(ll))]
+                break
+
+    for line, l in zip(lines, ll):
+        for w, tag in zip(line, l("word")):
+            w.mqdq = tag
     return LineSet(lines)
 
 
+def _syllabify_at(i, l) -> Line:
+    # do it this way so we can fail more informatively
+    try:
+        return syllabify_line(l)
+    except ValueError as e:
+        print(f"Failed to syllabify at index {i} on {l}")
+        raise e
+
+
+def _syllabify_shard(start, ll) -> tuple[list[Line], Optional[int]]:
+    # Worker side of syllabify: the Lines up to the first failure, and the
+    # index of that failure (or None). The caller repeats the failing line,
+    # so whatever it prints here is dropped.
+    lines = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, l in enumerate(ll):
+            try:
+                lines.append(syllabify_line(l))
+            except Exception:
+                return lines, start + i
+    return lines, None
+
+
 # 10/11/20 bumped i-e slightly and o-a slightly based on
 # Hirjee & Brown
 NUCLEUS_SCORES = {
@@ -997,24 +1168,21 @@ def word_rhyme(w1, w2) -> float:
     return score
 
 
-def _stash_prodelision(l):
-    # this list will hold tuples of (idx, removed_word)
-    removed = []
-    # two passes, one to get the unaltered indices
-    # then one to delete stuff
+def _fully_elided(w) -> bool:
+    return w.syls == ["_"]
+
+
+def _color_elided(l):
+    # Fully elided words take their colour from a neighbour: the word before
+    # for prodelision, and the next word that isn't fully elided for
+    # synalepha. The line itself isn't changed.
     for x, w in enumerate(l):
-        if w.syls == ["_"]:
-            removed.append((x, w))
-    if len(removed) > 0:
-        for k, (x, _) in enumerate(removed):
-            del l[x - k]
-    return removed
-
-
-def _restore_prodelision(l, removed):
-    for i, (x, w) in enumerate(removed):
-        l.insert(x + i, w)
-        if w.mqdq["mf"] == "PE":
-            l[x].color = l[x - 1].color
-        elif w.mqdq["mf"] == "SY":
-            l[x].color = l[x + 1].color
+        if not _fully_elided(w):
+            continue
+        if w.mf == "PE":
+            w.color = l[x - 1].color
+        elif w.mf == "SY":
+            nxt = next(
+                (y for y in range(x + 1, len(l)) if not _fully_elided(l[y])), len(l)
+            )
+            w.color = l[nxt].color
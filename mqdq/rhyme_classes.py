@@ -1,7 +1,6 @@
 from collections import UserList
-from dataclasses import dataclass
-from typing import List, Any, Union
-import bs4
+from dataclasses import dataclass, fields
+from typing import List, Any, Optional, Union
 from mqdq import rhyme
 import seaborn as sns
 import copy
@@ -46,49 +45,68 @@ class Syl(str):
         return ""
 
 
-@dataclass
+@dataclass(slots=True)
 class Word:
     pre_punct: str
     syls: List[Syl]
     post_punct: str
-    mqdq: bs4.element.Tag
+    # The source <word> (bs4 Tag or reader.WordRecord). Optional - the fields
+    # below are copied out of it when the Word is built, and that is what the
+    # rhyme code reads, so a Word can be built without one.
+    mqdq: Optional[Any] = None
     color: str = ""
     best_match: float = 0.0
     best_word: Union[
         "Word", None
     ] = None  # refs to own class should be written as strings
     lock_color: bool = False
-
-    # a copy should at least reset the color etc. This isn't perfect. If for example
-    # someone expected to be able to make copies of Words before applying
-    # line-level elision etc then they're going to be disappointed because
-    # syls is a ref not a copy.
+    # plain copies of the MQDQ attributes. Missing attributes are an empty
+    # string and not None so that we can always safely do startswith and
+    # endswith
+    text: str = ""
+    sy: str = ""
+    wb: str = ""
+    mf: str = ""
+
+    def __post_init__(self):
+        if self.mqdq is not None:
+            w = self.mqdq
+            self.text = w.text
+            self.sy = str(w.get("sy", ""))
+            self.wb = str(w.get("wb", ""))
+            self.mf = str(w.get("mf", ""))
+
+    # a copy should at least reset the color etc. syls is a ref not a copy, which
+    # is safe because nothing changes syls in place once a Word is built (the
+    # line-level elision makes new Words), so copies of Lines and LineSets all
+    # share the one syllabification.
     def __copy__(self) -> "Word":
-        return Word(self.pre_punct, self.syls, self.post_punct, self.mqdq)
-
-    # quality of life shortcuts
-    # return an empty string and not None so that
-    # we can always safely do startswith and endswith
-    @property
-    def wb(self) -> str:
-        try:
-            return str(self.mqdq["wb"])
-        except KeyError:
-            return ""
-
-    @property
-    def mf(self) -> str:
-        try:
-            return str(self.mqdq["mf"])
-        except KeyError:
-            return ""
-
+        c = Word(
+            self.pre_punct,
+            self.syls,
+            self.post_punct,
+            text=self.text,
+            sy=self.sy,
+            wb=self.wb,
+            mf=self.mf,
+        )
+        c.mqdq = self.mqdq
+        return c
+
+    # Pickle without the source <word>, which for a bs4 Tag would drag the
+    # whole tree along. Everything the rhyme code reads was copied out of it.
+    def __getstate__(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "mqdq"}
+
+    def __setstate__(self, state: dict):
+        self.mqdq = None
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    # old name, from when this read through to the Tag
     @property
     def mqdq_sy(self) -> str:
-        try:
-            return str(self.mqdq["sy"])
-        except KeyError:
-            return ""
+        return self.sy
 
     @property
     def stress_idx(self) -> int:
@@ -138,11 +156,7 @@ class Line(UserList):
 
     @property
     def midword(self) -> Union[Word, None]:
-        mid = [
-            w
-            for w in self.words
-            if w.mqdq_sy.endswith("3A") or w.mqdq_sy.endswith("3b")
-        ]
+        mid = [w for w in self.words if w.sy.endswith(("3A", "3b"))]
         if len(mid) > 1:
             # Can happen when 3b is a monosyllable. For now call it strong
             return mid[0]
@@ -160,11 +174,11 @@ class Line(UserList):
     @property
     def midword_idx(self) -> Union[int, None]:
         for i, w in enumerate(self.words):
-            if w.mqdq_sy.endswith("3A"):
+            if w.sy.endswith("3A"):
                 # this will always trigger first, so if we have
                 # a choice, take the strong caesura
                 return i
-            elif w.mqdq_sy.endswith("3b"):
+            elif w.sy.endswith("3b"):
                 return i
         return None
 
@@ -259,11 +273,12 @@ class LineSet(UserList):
         # color takes a linked (cf link) set of lines and applies the
         # deterministic colouring metadata
 
-        stash = [rhyme._stash_prodelision(l) for l in self.data]
-
+        # fully elided words (syls == ["_"]) aren't coloured in their own
+        # right, they take the colour of their neighbour afterwards, so they're
+        # skipped here rather than taken out of the line and put back.
         for l in self.data:
             for w in l:
-                if w.best_word:
+                if w.best_word and not rhyme._fully_elided(w):
                     rhymeset = [w, w.best_word]
                     next_w = w.best_word.best_word
                     # follow the best-word matches for each word in this rhyme
@@ -295,8 +310,8 @@ class LineSet(UserList):
                             else:
                                 w.color = colorfrom.get_color()
 
-        for i, stashed_prod in enumerate(stash):
-            rhyme._restore_prodelision(self.data[i], stashed_prod)
+        for l in self.data:
+            rhyme._color_elided(l)
 
     def colorlink(
         self,
@@ -0,0 +1,280 @@
+"""
+Line-level inverted index for searching MQDQ texts.
+
+Every word is indexed under several forms:
+
+- "text": the word exactly as it appears, punctuation and all (this is what
+  utils.grep has always matched against)
+- "form": lower case, punctuation stripped
+- "orth": normalised orthography, as "form" but with j/v folded to i/u and
+  any diacritics removed, so eg "Iuno", "Juno" and "IVNO" all match
+- "phon": the phonemic form from line_analyzer.raw_phonemics (optional,
+  because it needs the whole text to be syllabified)
+
+Postings are (line, position) pairs, so queries can ask for lines containing
+all of several words, or for exact phrases. Query terms can be regular
+expressions, which are matched against the vocabulary (which is small) rather
+than against every word in the text. Results are line references.
+"""
+
+import pathlib
+import re
+import string
+import unicodedata
+from collections import defaultdict
+from typing import Any, Iterable, NamedTuple, Optional
+from mqdq import cache
+from mqdq import corpus
+from mqdq import line_analyzer as la
+
+KINDS = ("text", "form", "orth", "phon")
+
+DEPUNCT = str.maketrans("", "", string.punctuation)
+ORTH = str.maketrans("jJvV", "iIuU")
+
+
+def _form(s: str) -> str:
+    return s.translate(DEPUNCT).lower()
+
+
+def _orth(s: str) -> str:
+    s = s.translate(DEPUNCT).translate(ORTH)
+    if not s.isascii():
+        s = unicodedata.normalize("NFD", s)
+        s = "".join(c for c in s if not unicodedata.combining(c))
+    return s.lower()
+
+
+def _phon(s: str) -> str:
+    return s.lower().translate(la.DEFANCY)
+
+
+# how each kind of term is normalised (for queries too)
+NORMALISE = {"text": lambda s: s, "form": _form, "orth": _orth, "phon": _phon}
+
+
+class Ref(NamedTuple):
+    """A reference to an indexed line. book is the division title, line is
+    the line name (both as in the XML) and index is the line's position in
+    the SearchIndex."""
+
+    work: str
+    book: str
+    line: str
+    index: int
+
+    def __str__(self) -> str:
+        return "%s %s:%s" % (self.work, self.book, self.line)
+
+
+class SearchIndex:
+    """
+    An inverted index over the lines of one or more texts.
+
+    Args:
+        phonetic (bool, default=False): Also index the phonemic forms. This
+            syllabifies every line, which is much slower than the rest.
+    """
+
+    def __init__(self, phonetic: bool = False):
+        self.phonetic = phonetic
+        self.refs: list[Ref] = []
+        self.lines: list[Any] = []
+        # kind -> term -> list of (line index, word position)
+        self.postings: dict[str, dict[str, list[tuple[int, int]]]] = {
+            k: defaultdict(list) for k in KINDS
+        }
+        # word text -> its (text, form, orth) terms, since most words repeat
+        self._terms: dict[str, tuple[str, str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __repr__(self) -> str:
+        works = len(set(r.work for r in self.refs))
+        return "<SearchIndex (%d works, %d lines)>" % (works, len(self))
+
+    @classmethod
+    def from_files(cls, fns: Iterable[str], phonetic: bool = False) -> "SearchIndex":
+        """
+        Build an index over some XML files, loaded through cache.load_corpus.
+        Works are named by the file stem (eg VERG-aene).
+
+        Args:
+            fns (iterable of str): The files
+            phonetic (bool, default=False): Also index the phonemic forms
+
+        Returns:
+            SearchIndex: The index
+        """
+        idx = cls(phonetic)
+        for fn in fns:
+            idx.add(cache.load_corpus(fn), pathlib.Path(fn).stem)
+        return idx
+
+    def add(self, soup, work: str = ""):
+        """
+        Index every line of a text.
+
+        Args:
+            soup (BeautifulSoup, reader.Document or corpus.Corpus): The text
+            work (str, optional): The name to use in the references
+        """
+        if isinstance(soup, corpus.Corpus):
+            # read the columns directly instead of going through word views
+            text, o = soup.text.tolist(), soup.line_offsets.tolist()
+            titles, div_of = soup.div_title.tolist(), soup.line_divisions().tolist()
+            for i, l in enumerate(soup):
+                ref = Ref(work, titles[div_of[i]], l["name"], len(self.lines))
+                self.add_line(l, ref, text[o[i] : o[i + 1]])
+            return
+
+        for l in soup("line"):
+            p = getattr(l, "parent", None)
+            book = p.get("title", "") if getattr(p, "name", "") == "division" else ""
+            self.add_line(l, Ref(work, book, l.get("name", ""), len(self.lines)))
+
+    def add_line(self, l, ref: Optional[Ref] = None, words: Optional[list[str]] = None):
+        """
+        Index a single line.
+
+        Args:
+            l (bs4 <line>): The line
+            ref (Ref, optional): Its reference (default: no work or book)
+            words (list of str, optional): The text of the words, if the caller
+                already has it
+        """
+        i = len(self.lines)
+        if ref is None:
+            ref = Ref("", "", l.get("name", ""), i)
+        self.lines.append(l)
+        self.refs.append(ref)
+        if words is None:
+            words = [w.text for w in l("word")]
+        forms: dict[str, list[str]] = {k: [] for k in KINDS}
+        for w in words:
+            ts = self._terms.get(w)
+            if ts is None:
+                ts = self._terms[w] = (w, _form(w), _orth(w))
+            forms["text"].append(ts[0])
+            forms["form"].append(ts[1])
+            forms["orth"].append(ts[2])
+        if self.phonetic:
+            try:
+                forms["phon"] = la.raw_phonemics(l)
+            except Exception:
+                # unsyllabifiable lines (corrupt words etc) just don't get a
+                # phonetic entry
+                forms["phon"] = []
+        for k, ts in forms.items():
+            p = self.postings[k]
+            for pos, t in enumerate(ts):
+                if t:
+                    p[t].append((i, pos))
+
+    def term_postings(self, term: str, kind: str, regex: bool) -> dict[int, set]:
+        """
+        Look up a single term.
+
+        Args:
+            term (str): The term
+            kind (str): Which forms to match
+            regex (bool): Treat the term as a case insensitive regex
+
+        Returns:
+            dict[int, set]: line index -> the word positions that match
+        """
+        if kind == "phon" and not self.phonetic:
+            raise ValueError("Index was built without phonetic=True")
+        p = self.postings[kind]
+        if regex:
+            r = re.compile(term, re.IGNORECASE)
+            terms = [t for t in p if r.search(t)]
+        else:
+            terms = [NORMALISE[kind](term)]
+        res: dict[int, set] = defaultdict(set)
+        for t in terms:
+            for li, pos in p.get(t, ()):
+                res[li].add(pos)
+        return res
+
+    def lines_for(
+        self,
+        query: str,
+        kind: str = "orth",
+        phrase: bool = False,
+        regex: bool = False,
+    ) -> list[int]:
+        """
+        Run a query, returning the indices of the matching lines.
+
+        Args:
+            query (str): Whitespace separated terms
+            kind (str, default="orth"): Which forms to match ("text", "form",
+                "orth" or "phon")
+            phrase (bool, default=False): The terms must appear consecutively,
+                in order. Otherwise they can appear anywhere in the line.
+            regex (bool, default=False): Treat each term as a (case insensitive)
+                regular expression, searched for in each indexed term
+
+        Returns:
+            list[int]: Matching line indices, in index order
+        """
+        if kind not in KINDS:
+            raise ValueError("Unknown kind %s, try one of %s" % (kind, KINDS))
+        terms = query.split()
+        if not terms:
+            return []
+        per_term = [self.term_postings(t, kind, regex) for t in terms]
+        # start from the rarest term
+        hits = set(min(per_term, key=len))
+        for pt in per_term:
+            hits &= pt.keys()
+        if phrase:
+            hits = {
+                li
+                for li in hits
+                if any(
+                    all(start + k in per_term[k][li] for k in range(1, len(terms)))
+                    for start in per_term[0][li]
+                )
+            }
+        return sorted(hits)
+
+    def search(
+        self,
+        query: str,
+        kind: str = "orth",
+        phrase: bool = False,
+        regex: bool = False,
+    ) -> list[Ref]:
+        """
+        Run a query, returning line references. Arguments as for lines_for.
+
+        Returns:
+            list[Ref]: References to the matching lines
+        """
+        return [self.refs[i] for i in self.lines_for(query, kind, phrase, regex)]
+
+    def line(self, ref: Ref) -> Any:
+        """The indexed line for a reference."""
+        return self.lines[ref.index]
+
+
+def bundled_index(phonetic: bool = False) -> SearchIndex:
+    """
+    Build an index over all of the works that ship with the package.
+
+    Args:
+        phonetic (bool, default=False): Also index the phonemic forms (slow)
+
+    Returns:
+        SearchIndex: The index
+    """
+    # store imports cache, which is fine, but keep this module importable
+    # from utils without dragging the converter in
+    from mqdq import store
+
+    return SearchIndex.from_files(
+        [str(fn) for fn in store.bundled_works()], phonetic=phonetic
+    )
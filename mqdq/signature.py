@@ -0,0 +1,213 @@
+"""
+Compact integer metrical signatures.
+
+Every line gets one uint64 packing the facts that are most often counted
+together: the metre, the foot pattern, and the caesura in, diaeresis after
+and ictus/accent conflict in each of the four feet that the binary features
+use (1-4 for hexameters, 1, 2, 4 and 5 for pentameters), plus the elision
+count. The signatures come from the per line features, so they are computed
+in bulk (and via the on-disk feature cache, see cache.line_features).
+
+Questions like "how many lines are DSSS with a strong caesura in the third
+foot and bucolic diaeresis?" are then integer comparisons over one array,
+and frequency tables are a np.unique.
+
+Each field decodes to a string, one character per foot, as in the rest of
+the library (eg caesurae "-SW-" as from line_analyzer.caesurae, diaereses
+"FFFT" as from line_analyzer.diaereses, harmony "HCHH"), except elisions,
+which is an int.
+"""
+
+from typing import Iterable, NamedTuple, Union
+import numpy as np
+import pandas as pd
+from mqdq import cache
+from mqdq import corpus
+from mqdq import line_analyzer as la
+
+
+class Field(NamedTuple):
+    """Where a field lives in the signature. Strings are stored a character
+    at a time, bits per character, as the index of the character in
+    alphabet. Numeric fields have no alphabet."""
+
+    shift: int
+    bits: int
+    width: int
+    alphabet: str = ""
+
+    @property
+    def mask(self) -> int:
+        return ((1 << (self.bits * self.width)) - 1) << self.shift
+
+
+FIELDS = {
+    "metre": Field(0, 2, 1, "?HP"),
+    "pattern": Field(2, 1, 4, "DS"),
+    "caesurae": Field(6, 3, 4, la._CAESURAE),
+    "diaereses": Field(18, 1, 4, "FT"),
+    "harmony": Field(22, 1, 4, "HC"),
+    "elisions": Field(26, 8, 1),
+}
+
+# the per line features that the signature is built from
+_FEATS = (
+    ["%dSP" % k for k in range(1, 5)]
+    + ["%dDI" % k for k in range(1, 5)]
+    + ["%dCF" % k for k in range(1, 5)]
+    + ["ELC"]
+)
+
+
+class Signature(NamedTuple):
+    """A decoded signature."""
+
+    metre: str
+    pattern: str
+    caesurae: str
+    diaereses: str
+    harmony: str
+    elisions: int
+
+
+def signatures(ll, cached: bool = False) -> np.ndarray:
+    """
+    The signature of every line.
+
+    Args:
+        ll (list of bs4 <line>s, or a corpus.Corpus): Lines to operate on
+        cached (bool, default=False): Use (and fill) the on-disk feature cache,
+            which writes files to cache.default_cache_dir()
+
+    Returns:
+        numpy.ndarray: uint64, one per line
+    """
+    if not isinstance(ll, corpus.Corpus):
+        ll = list(ll)
+    features = cache.line_features if cached else la.feature_matrix
+    m = features(ll, _FEATS).astype(np.uint64)
+    caes = features(ll, ["CAES"])[:, 0].astype("<U4")
+    metre = ll.metres() if isinstance(ll, corpus.Corpus) else [l["metre"] for l in ll]
+
+    sig = np.zeros(len(ll), dtype=np.uint64)
+    f = FIELDS["metre"]
+    sig |= np.array([f.alphabet.find(mt) for mt in metre], dtype=np.uint64)
+    for k in range(4):
+        for name, col in [("pattern", k), ("diaereses", 4 + k), ("harmony", 8 + k)]:
+            f = FIELDS[name]
+            sig |= m[:, col] << np.uint64(f.shift + k * f.bits)
+    sig |= m[:, 12] << np.uint64(FIELDS["elisions"].shift)
+
+    # caesura characters -> their codes, a foot at a time
+    chars = caes.view(np.uint32).reshape(-1, 4)
+    table = np.zeros(128, dtype=np.uint64)
+    f = FIELDS["caesurae"]
+    for i, c in enumerate(f.alphabet):
+        table[ord(c)] = i
+    for k in range(4):
+        sig |= table[chars[:, k]] << np.uint64(f.shift + k * f.bits)
+    return sig
+
+
+def decode(sig: int) -> Signature:
+    """
+    Unpack a signature.
+
+    Args:
+        sig (int): The signature
+
+    Returns:
+        Signature: The fields
+    """
+    sig = int(sig)
+    res = {}
+    for name, f in FIELDS.items():
+        if not f.alphabet:
+            res[name] = (sig & f.mask) >> f.shift
+            continue
+        codes = [
+            (sig >> (f.shift + k * f.bits)) & ((1 << f.bits) - 1)
+            for k in range(f.width)
+        ]
+        res[name] = "".join(f.alphabet[c] for c in codes)
+    return Signature(**res)
+
+
+def encode(**fields: Union[str, int]) -> tuple[int, int]:
+    """
+    Build a value and a mask that match some fields, eg
+    encode(pattern="DSSS", caesurae="..S.", diaereses="...T"). A "." in a
+    string field matches anything in that foot.
+
+    Args:
+        **fields (str or int): Field values, by name (see FIELDS)
+
+    Returns:
+        (int, int): Signatures that match have sig & mask == value
+    """
+    value, mask = 0, 0
+    for name, v in fields.items():
+        if name not in FIELDS:
+            raise KeyError("Unknown field %s, try one of %s" % (name, list(FIELDS)))
+        f = FIELDS[name]
+        if not f.alphabet:
+            if not 0 <= int(v) < 1 << f.bits:
+                raise ValueError("%s out of range: %s" % (name, v))
+            value |= int(v) << f.shift
+            mask |= f.mask
+            continue
+        if len(str(v)) != f.width:
+            raise ValueError("%s should be %d characters: %r" % (name, f.width, v))
+        for k, c in enumerate(str(v)):
+            if c == ".":
+                continue
+            if c not in f.alphabet:
+                raise ValueError("Bad character %r in %s: %r" % (c, name, v))
+            shift = f.shift + k * f.bits
+            value |= f.alphabet.index(c) << shift
+            mask |= ((1 << f.bits) - 1) << shift
+    return value, mask
+
+
+def lookup(sigs: np.ndarray, **fields: Union[str, int]) -> np.ndarray:
+    """
+    Find the lines whose signatures match some fields (as for encode).
+
+    Args:
+        sigs (numpy.ndarray): Signatures, as from signatures
+        **fields (str or int): Field values, by name (see FIELDS)
+
+    Returns:
+        numpy.ndarray: Indices of the matching lines
+    """
+    value, mask = encode(**fields)
+    return np.flatnonzero((sigs & np.uint64(mask)) == np.uint64(value))
+
+
+def counts(sigs: np.ndarray, by: Iterable[str] = ("pattern", "caesurae")) -> pd.Series:
+    """
+    Count the lines sharing the same values of some fields.
+
+    Args:
+        sigs (numpy.ndarray): Signatures, as from signatures
+        by (iterable of str, default=("pattern", "caesurae")): Fields to group
+            by (see FIELDS)
+
+    Returns:
+        pandas.Series: Number of lines, indexed by the field values, most
+        common first
+    """
+    by = list(by)
+    for name in by:
+        if name not in FIELDS:
+            raise KeyError("Unknown field %s, try one of %s" % (name, list(FIELDS)))
+    mask = np.uint64(sum(FIELDS[name].mask for name in by))
+    keys, n = np.unique(sigs & mask, return_counts=True)
+    rows = [decode(k) for k in keys]
+    index = pd.MultiIndex.from_tuples(
+        [tuple(getattr(r, name) for name in by) for r in rows], names=by
+    )
+    if len(by) == 1:
+        index = index.get_level_values(0)
+    res = pd.Series(n, index=index, name="lines")
+    return res.sort_values(ascending=False, kind="stable")
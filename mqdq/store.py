@@ -0,0 +1,179 @@
+"""
+Memory-mapped binary store for MQDQ corpora.
+
+A store is a directory holding one .npy file per Corpus column (fixed-width
+numeric arrays, with the strings packed into UTF-8 heaps plus offsets) and a
+small store.json. Opening a store memory-maps the arrays read-only, so there
+is no parsing at all, and several worker processes that open the same store
+share one copy of it in the page cache.
+
+The bundled works can be converted with
+
+    python -m mqdq.store
+
+which writes eg VERG-aene.corpus/ next to VERG-aene.xml. After that, load()
+(and so hexameter_corpus.geezit_corpus) will open the store instead of
+touching the XML.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import numpy as np
+from typing import Optional, Union
+import mqdq
+from mqdq import cache
+from mqdq import corpus
+
+PathLike = Union[str, pathlib.Path]
+
+SUFFIX = ".corpus"
+_INFO = "store.json"
+
+
+def bundled_works() -> list[pathlib.Path]:
+    """The XML files that ship with the package."""
+    return sorted(pathlib.Path(__file__).parent.glob("*.xml"))
+
+
+def store_path(fn: PathLike) -> pathlib.Path:
+    """Where the store for a given XML file lives (next to it)."""
+    return pathlib.Path(fn).with_suffix(SUFFIX)
+
+
+def save(c: corpus.Corpus, path: PathLike, info: Optional[dict] = None):
+    """
+    Write a Corpus as a store directory. Any existing store at that path is
+    replaced.
+
+    Args:
+        c (corpus.Corpus): The corpus
+        path (str or Path): The directory to write
+        info (dict, optional): Extra JSON-able data to record in store.json
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # build in a temp dir and move it into place, so that readers never see
+    # a half written store
+    tmp = pathlib.Path(tempfile.mkdtemp(dir=path.parent, prefix=path.name + "."))
+    try:
+        for k, ary in c.to_arrays().items():
+            np.save(tmp / (k + ".npy"), np.ascontiguousarray(ary), allow_pickle=False)
+        meta = {"version": mqdq.__version__}
+        meta.update(info or {})
+        (tmp / _INFO).write_text(json.dumps(meta))
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def info(path: PathLike) -> dict:
+    """The contents of store.json for a store."""
+    return json.loads((pathlib.Path(path) / _INFO).read_text())
+
+
+def open_store(path: PathLike, mmap: bool = True) -> corpus.Corpus:
+    """
+    Open a store directory as a Corpus.
+
+    Args:
+        path (str or Path): The store directory
+        mmap (bool, default=True): Memory-map the arrays read-only. Strings are
+            then decoded from the heaps on access. With mmap=False everything is
+            read into memory and the strings are decoded up front.
+
+    Returns:
+        corpus.Corpus: The result
+    """
+    path = pathlib.Path(path)
+    arrays = {
+        f.stem: np.load(f, mmap_mode="r" if mmap else None, allow_pickle=False)
+        for f in path.glob("*.npy")
+    }
+    return corpus.Corpus.from_arrays(arrays, decode=not mmap)
+
+
+def is_fresh(fn: PathLike, path: Optional[PathLike] = None) -> bool:
+    """
+    Check whether a store exists for an XML file, and was built from the
+    current contents of that file by the current mqdq version.
+    """
+    path = pathlib.Path(path) if path else store_path(fn)
+    try:
+        meta = info(path)
+    except (OSError, ValueError):
+        return False
+    same_version = meta.get("version") == mqdq.__version__
+    return same_version and meta.get("sha1") == cache.file_hash(fn)
+
+
+def convert(fn: PathLike, out: Optional[PathLike] = None) -> pathlib.Path:
+    """
+    Parse and clean an XML file and write it as a store.
+
+    Args:
+        fn (str or Path): The XML file
+        out (str or Path, optional): The store directory (default: next to the XML)
+
+    Returns:
+        pathlib.Path: The store directory
+    """
+    out = pathlib.Path(out) if out else store_path(fn)
+    c = corpus.Corpus.from_file(str(fn))
+    save(c, out, {"sha1": cache.file_hash(fn), "source": pathlib.Path(fn).name})
+    return out
+
+
+def load(fn: PathLike, mmap: bool = True) -> corpus.Corpus:
+    """
+    Load an XML file as a cleaned Corpus, opening its store if there is an up
+    to date one, and otherwise going through cache.load_corpus.
+
+    Args:
+        fn (str or Path): The XML file
+        mmap (bool, default=True): Memory-map the store, if there is one
+
+    Returns:
+        corpus.Corpus: The result
+    """
+    if is_fresh(fn):
+        return open_store(store_path(fn), mmap=mmap)
+    return cache.load_corpus(fn)
+
+
+def main(argv: Optional[list[str]] = None):
+    p = argparse.ArgumentParser(
+        prog="python -m mqdq.store",
+        description="Convert MQDQ XML files to memory-mapped corpus stores.",
+    )
+    p.add_argument(
+        "files", nargs="*", help="XML files to convert (default: the bundled works)"
+    )
+    p.add_argument(
+        "-o", "--outdir", help="Write the stores here instead of next to the XML"
+    )
+    p.add_argument(
+        "-f", "--force", action="store_true", help="Rebuild up to date stores too"
+    )
+    args = p.parse_args(argv)
+
+    for fn in [pathlib.Path(f) for f in args.files] or bundled_works():
+        out = store_path(fn)
+        if args.outdir:
+            out = pathlib.Path(args.outdir) / out.name
+        if not args.force and is_fresh(fn, out):
+            print("%s: up to date" % out)
+            continue
+        convert(fn, out)
+        print("%s: written" % out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
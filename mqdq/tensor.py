@@ -64,7 +64,7 @@ def _syl_meta(w: Word) -> list[list[float]]:
     Returns:
         List[List[float]]: the result.
     """
-    syls = re.findall(re.compile(".."), str(w.mqdq["sy"]))
+    syls = re.findall(re.compile(".."), w.sy)
     final = []
     for i, s in enumerate(syls):
 
@@ -85,13 +85,13 @@ def _syl_meta(w: Word) -> list[list[float]]:
             # Long
             meta |= 0b1000000
         if i == len(syls) - 1:
-            if w.mqdq.has_attr("wb"):
+            if w.wb:
                 # Assorted word breaks, which can appear in the last syl only
-                if w.mqdq["wb"] == "CM":
+                if w.wb == "CM":
                     meta |= 0b10000
-                elif w.mqdq["wb"] == "DI":
+                elif w.wb == "DI":
                     meta |= 0b1000
-                elif w.mqdq["wb"] == "CF":
+                elif w.wb == "CF":
                     meta |= 0b100
             if w.mf == "SY":
                 # Elision
@@ -157,7 +157,7 @@ def loose_layers(l: Line) -> np.ndarray:
     onset = ""
     cf = syn = long = pause = 0b0
     for w in l:
-        syls = re.findall(XX, str(w.mqdq["sy"]))
+        syls = re.findall(XX, w.sy)
         for i, s in enumerate(syls):
 
             # Since we enumerate the MQDQ syllable string, we shouldn't get any
@@ -181,12 +181,12 @@ def loose_layers(l: Line) -> np.ndarray:
             if i + 1 == len(syls):
                 # end of a word. Because these are OR'd it's possible for a
                 # metron with two breves to contain two pauses (eg CM and CF).
-                if w.mqdq.has_attr("wb"):
-                    if w.mqdq["wb"] == "CM":
+                if w.wb:
+                    if w.wb == "CM":
                         pause |= 0b100
-                    elif w.mqdq["wb"] == "DI":
+                    elif w.wb == "DI":
                         pause |= 0b10
-                    elif w.mqdq["wb"] == "CF":
+                    elif w.wb == "CF":
                         pause |= 0b1
                 if w.mf == "SY":
                     # Elision aka synalepha
@@ -4,12 +4,16 @@ from bs4.element import Tag
 import re
 import numpy as np
 import pandas as pd
-from typing import Optional, Union, cast
+from collections.abc import Sequence
+from typing import Any, Callable, Optional, Union, cast
 from mqdq import line_analyzer as la
 from mqdq import rhyme
+from mqdq import reader
+from mqdq import search
 from mqdq.rhyme_classes import Line
 import unicodedata
 import bisect
+import weakref
 
 import dominate
 from dominate import tags
@@ -24,10 +28,11 @@ DEFANCY = str.maketrans(
 
 def grep(soup: BeautifulSoup, s: str) -> list[Tag]:
     """
-    Case insensitive grep on the text contents of BeautifulSoup object.
+    Case insensitive grep on the text contents of BeautifulSoup object
+    (or a reader.Document).
 
     Args:
-        soup (BeautifulSoup): The text in which to search
+        soup (BeautifulSoup or reader.Document): The text in which to search
         s (str): String to search for. This will be converted
                     into a regular expression, so re characters
                     are allowed.
@@ -36,11 +41,10 @@ def grep(soup: BeautifulSoup, s: str) -> list[Tag]:
         list[bs4.element.Tag]: a list of matching bs4.element.Tags
     """
 
-    # TODO this is word by word only! Rewrite to get some kind of
-    # at least line-by-line search
-
-    r = re.compile(s, re.IGNORECASE)
-    return list(set(s.parent.parent for s in soup.find_all(string=r)))
+    # NB this is still word by word. See search.SearchIndex for multi-word
+    # and phrase queries.
+    idx = _soup_cached(_SEARCH_INDEXES, soup, _text_index)
+    return [idx.lines[i] for i in sorted(idx.term_postings(s, "text", regex=True))]
 
 
 def blat(
@@ -57,7 +61,7 @@ def blat(
         scan (bool, default=False): Include scansion codes
         phon (bool, default=False): Include phonetic transcription
         number_with (BeautifulSoup): If provided, text will be numbered by finding the lines
-                                in that bs4 object (WARNING! Can be slow!):
+                                in that bs4 object:
                                 8:196> Caede tepebat humus, foribusque affixa  superbis
                                        1A'1b 1c2A'2b 2c'3A  3b3c4A'_   4T5A'5b 5c6A'6X
     Returns:
@@ -85,7 +89,7 @@ def blatsave(
         scan (bool, default=False): Include scansion codes
         phon (bool, default=False): Include phonetic transcription
         number_with (BeautifulSoup): If provided, text will be numbered by finding the lines
-                                in that bs4 object (WARNING! Can be slow!):
+                                in that bs4 object:
                                 8:196> Caede tepebat humus, fo
                                        1A'1b 1c2A'2b 2c'3A  3b3c4A'_   4T5A'5b 5c6A'6X
 
@@ -111,7 +115,7 @@ def txt(
         scan (bool, default=False): Include scansion codes
         phon (bool, default=False): Include phonetic transcription
         number_with (BeautifulSoup): If provided, text will be numbered by finding the lines
-                                in that bs4 object (WARNING! Can be slow!):
+                                in that bs4 object:
                                 8:196> Caede tepebat humus, foribusque affixa  superbis
                                        1A'1b 1c2A'2b 2c'3A  3b3c4A'_   4T5A'5b 5c6A'6X WSQ
     Returns:
@@ -230,6 +234,122 @@ def txt_and_number(
     return numbered
 
 
+class RefIndex:
+    """
+    An index from the lines of a soup (or reader.Document, or corpus.Corpus)
+    to their references, built once so that which_book, bookref, by_ref etc
+    don't have to scan every division for every line.
+
+    Lines are keyed by identity (bs4 hashes a Tag by rendering it to a string,
+    which is very slow) or by (corpus, index) for Corpus line views. The index
+    keeps a reference to every line, so the ids stay valid for as long as the
+    index is alive. It is not updated if the soup is modified afterwards - use
+    ref_index(soup, rebuild=True).
+
+    Args:
+        soup (BeautifulSoup, reader.Document or corpus.Corpus): The text
+    """
+
+    def __init__(self, soup):
+        self.titles: list[str] = []
+        self.books: list[list[Tag]] = []
+        # global index of the first line of each book, plus the total
+        self.starts: list[int] = [0]
+        self._pos: dict[Any, tuple[int, int]] = {}
+        for b_idx, d in enumerate(soup("division")):
+            ll = d("line")
+            self.titles.append(d["title"])
+            self.books.append(ll)
+            for l_idx, l in enumerate(ll):
+                self._pos[self._key(l)] = (b_idx, l_idx)
+            self.starts.append(self.starts[-1] + len(ll))
+
+    @staticmethod
+    def _key(l) -> Any:
+        c = getattr(l, "corpus", None)
+        if c is not None:
+            return (id(c), l.index)
+        return id(l)
+
+    def __len__(self) -> int:
+        return self.starts[-1]
+
+    def locate(self, l: Tag) -> Union[tuple[int, int], None]:
+        """
+        Find a line.
+
+        Args:
+            l (bs4.element.Tag): The line
+
+        Returns:
+            tuple[int, int]: (book index, line index in the book), both 0-based,
+            or None if the line isn't in this text
+        """
+        return self._pos.get(self._key(l))
+
+    def which_book(self, l: Tag) -> Union[str, None]:
+        pos = self.locate(l)
+        return None if pos is None else self.titles[pos[0]]
+
+    def global_index(self, l: Tag) -> Union[int, None]:
+        pos = self.locate(l)
+        return None if pos is None else self.starts[pos[0]] + pos[1]
+
+    def by_ref(self, bn: int, ln: int) -> Tag:
+        # 1-based, and negative indices work the way they always did
+        return self.books[bn - 1][ln - 1]
+
+    def from_index(self, idx: int) -> tuple[int, int]:
+        """
+        Convert a global line index (0-based) to (book number, line index in
+        the book), with the book number 1-based.
+        """
+        # (negative indices land in the first book, as they always have)
+        insert_at = max(bisect.bisect_right(self.starts, idx) - 1, 0)
+        if insert_at >= len(self.books):
+            raise IndexError("Line index out of range")
+        return insert_at + 1, idx - self.starts[insert_at]
+
+
+# Built indexes, keyed by id(soup) and dropped when the soup is collected.
+_REF_INDEXES: dict[int, RefIndex] = {}
+_SEARCH_INDEXES: dict[int, "search.SearchIndex"] = {}
+
+
+def _soup_cached(registry: dict, soup, build: Callable, rebuild: bool = False):
+    k = id(soup)
+    if not rebuild and k in registry:
+        return registry[k]
+    x = build(soup)
+    try:
+        weakref.finalize(soup, registry.pop, k, None)
+    except TypeError:
+        # can't tell when it goes away, so don't cache it
+        return x
+    registry[k] = x
+    return x
+
+
+def _text_index(soup) -> "search.SearchIndex":
+    idx = search.SearchIndex()
+    idx.add(soup)
+    return idx
+
+
+def ref_index(soup, rebuild: bool = False) -> RefIndex:
+    """
+    Get the (cached) RefIndex for a soup, Document or Corpus.
+
+    Args:
+        soup (BeautifulSoup, reader.Document or corpus.Corpus): The text
+        rebuild (bool, default=False): Rebuild it, eg if the soup was modified
+
+    Returns:
+        RefIndex: The index
+    """
+    return _soup_cached(_REF_INDEXES, soup, RefIndex, rebuild)
+
+
 def which_book(l: Tag, soup: BeautifulSoup) -> Union[str, None]:
     """
     Determine which book in a BeautifulSoup contains a given line.
@@ -243,16 +363,21 @@ def which_book(l: Tag, soup: BeautifulSoup) -> Union[str, None]:
         containing l (0-based) or None
     """
 
-    for d in soup("division"):
-        if l in d:
-            return d["title"]
+    b = ref_index(soup).which_book(l)
+    if b is not None:
+        return b
+    # Not found by identity. bs4 compares Tags by value, so a copy of a line
+    # used to be found too, and this keeps that working (slowly).
+    if isinstance(l, Tag):
+        for d in soup("division"):
+            if l in d:
+                return d["title"]
     return None
 
 
 def by_ref(bn: int, ln: int, soup: BeautifulSoup) -> Union[Tag, None]:
     try:
-        b = soup("division")[bn - 1]
-        return b("line")[ln - 1]
+        return ref_index(soup).by_ref(bn, ln)
     except IndexError:
         return None
 
@@ -272,7 +397,9 @@ def bookref(l: Tag, soup: BeautifulSoup) -> Union[str, None]:
     b = which_book(l, soup)
     if not b:
         return None
-    return "%2s:%-3d" % (b, int(str(l["name"])))
+    # some line names aren't plain numbers, eg 157a
+    name = str(l["name"])
+    return "%2s:%-3s" % (b, int(name) if name.isdigit() else name)
 
 
 def bookrange(ll: list[Tag], soup: BeautifulSoup) -> str:
@@ -414,22 +541,8 @@ def clean(ll: list[Tag]) -> list[Tag]:
 
 
 def indices_to_bookref(soup: BeautifulSoup, rr: list[int]) -> list[tuple[int, int]]:
-    # parsing the soup is slow, so do it once.
-    # get the starting points of each book
-    cumsums = list(np.cumsum([len(d("line")) for d in soup("division")]))
-    res = []
-    for ref in rr:
-        # finds leftmost start value greater than idx
-        insert_at = bisect.bisect_right(cumsums, ref)
-        if insert_at >= len(cumsums):
-            raise IndexError("Line index out of range")
-        br = insert_at + 1
-        lr = ref
-        if insert_at > 0:
-            # line idx in book is overall idx - start_of_book idx
-            lr = lr - cumsums[insert_at - 1]
-        res.append((br, lr))
-    return res
+    idx = ref_index(soup)
+    return [idx.from_index(ref) for ref in rr]
 
 
 def chunk_lines(
@@ -473,17 +586,81 @@ def chunk_lines(
     return df
 
 
-def slurp(fn: str) -> tuple[BeautifulSoup, list[Tag]]:
-    with open(fn) as fh:
-        soup = BeautifulSoup(fh, "xml")
-        ll = clean(soup("line"))
-    return soup, ll
+def slurp(fn: str) -> tuple[reader.Document, list[reader.LineRecord]]:
+    """
+    Read an MQDQ XML file and clean the lines. The Document can be used in place
+    of the old BeautifulSoup object (eg for number_with or bookref).
+
+    Args:
+        fn (str): Filename to read
+
+    Returns:
+        tuple[reader.Document, list[reader.LineRecord]]: The document and the
+        cleaned lines
+    """
+    doc = reader.read(fn)
+    return doc, clean(doc("line"))
 
 
-def bookinate(fn: str) -> list[list[Tag]]:
-    with open(fn) as fh:
-        soup = BeautifulSoup(fh, "xml")
-    return [clean(d("line")) for d in soup("division")]
+class LazyList(Sequence):
+    """
+    A fixed length, read-only sequence whose items are built by calling
+    build(i) the first time they are indexed, and kept after that.
+
+    Args:
+        n (int): The length
+        build (Callable[[int], Any]): Builds item i
+    """
+
+    def __init__(self, n: int, build: Callable[[int], Any]):
+        self._items: list[Any] = [None] * n
+        self._built = [False] * n
+        self._build = build
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("LazyList index out of range")
+        if not self._built[i]:
+            self._items[i] = self._build(i)
+            self._built[i] = True
+        return self._items[i]
+
+    def loaded(self) -> list[int]:
+        """The indices of the items that have been built so far."""
+        return [i for i, b in enumerate(self._built) if b]
+
+    def __repr__(self) -> str:
+        return "<LazyList (%d items, %d loaded)>" % (len(self), len(self.loaded()))
+
+
+def bookinate(
+    fn: str, lazy: bool = False
+) -> Union[list[list[reader.LineRecord]], LazyList]:
+    """
+    Read an MQDQ XML file and return the cleaned lines, one list per division.
+    Divisions are streamed, so only one is being built at a time.
+
+    With lazy=True, the file is only scanned for the division offsets, and each
+    division is parsed and cleaned when it is first indexed.
+
+    Args:
+        fn (str): Filename to read
+        lazy (bool, default=False): Return a LazyList instead of a list
+
+    Returns:
+        list[list[reader.LineRecord]]: The cleaned lines for each book
+    """
+    if lazy:
+        idx = reader.DivisionIndex(fn)
+        return LazyList(len(idx), lambda i: clean(idx[i]("line")))
+    return [clean(d("line")) for d in reader.iterdivisions(fn)]
 
 
 def _bloop(s: dominate.document):
@@ -535,9 +712,9 @@ def _make_p(
         para += tags.span("", style="padding-right: 1.5em")
     for w in l:
         if w.color:
-            para += tags.span(w.mqdq.text, style=setbg % w.color)
+            para += tags.span(w.text, style=setbg % w.color)
         else:
-            para += tags.span(w.mqdq.text)
+            para += tags.span(w.text)
     return para
 
 
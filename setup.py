@@ -7,6 +7,7 @@ setup(
     packages=["mqdq", "mqdq.cltk_hax"],
     license="3-Clause BSD",
     url="https://github.com/bnagy/mqdq-parser",
+    python_requires=">=3.10",
     long_description="""
 	mqdq is a collection of utility and analysis 
 	code for working with the XML format of scanned 
@@ -16,6 +17,7 @@ setup(
     install_requires=[
         "setuptools",
         "beautifulsoup4",
+        "lxml",
         "numpy",
         "scipy",
         "pandas",